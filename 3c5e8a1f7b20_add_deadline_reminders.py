@@ -0,0 +1,30 @@
+"""add deadline reminders
+
+Revision ID: 3c5e8a1f7b20
+Revises: fdabf1636d4d
+Create Date: 2026-10-18 12:04:11.527390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e8a1f7b20'
+down_revision: Union[str, Sequence[str], None] = 'fdabf1636d4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('homework_submissions', sa.Column('reminded_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_homework_assignments_deadline', 'homework_assignments', ['deadline'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_homework_assignments_deadline', table_name='homework_assignments')
+    op.drop_column('homework_submissions', 'reminded_at')
@@ -0,0 +1,32 @@
+"""add recurring lessons
+
+Revision ID: 5e2f7c9d1a48
+Revises: 9b1d4e6a2c73
+Create Date: 2026-10-18 15:02:54.310876
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2f7c9d1a48'
+down_revision: Union[str, Sequence[str], None] = '9b1d4e6a2c73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('lessons', sa.Column('duration_minutes', sa.Integer(), server_default='60', nullable=False))
+    op.add_column('lessons', sa.Column('series_id', sa.String(length=32), nullable=True))
+    op.create_index('ix_lessons_teacher_id_start_time', 'lessons', ['teacher_id', 'start_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_lessons_teacher_id_start_time', table_name='lessons')
+    op.drop_column('lessons', 'series_id')
+    op.drop_column('lessons', 'duration_minutes')
@@ -0,0 +1,44 @@
+"""add lesson debits
+
+Revision ID: 7a4c2e9f5b16
+Revises: 5e2f7c9d1a48
+Create Date: 2026-10-18 15:47:12.662091
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4c2e9f5b16'
+down_revision: Union[str, Sequence[str], None] = '5e2f7c9d1a48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('lessons', sa.Column('held_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_lessons_held_at_start_time', 'lessons', ['held_at', 'start_time'], unique=False)
+    # Прошедшие до миграции уроки считаем закрытыми, иначе первый проход списал бы их задним числом
+    op.execute("UPDATE lessons SET held_at = start_time WHERE start_time < CURRENT_TIMESTAMP")
+
+    op.create_table('lesson_debits',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lesson_id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('lesson_id', 'student_id', name='uq_lesson_debits_lesson_id_student_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('lesson_debits')
+    op.drop_index('ix_lessons_held_at_start_time', table_name='lessons')
+    op.drop_column('lessons', 'held_at')
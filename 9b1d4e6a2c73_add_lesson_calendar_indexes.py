@@ -0,0 +1,32 @@
+"""add lesson calendar indexes
+
+Revision ID: 9b1d4e6a2c73
+Revises: 3c5e8a1f7b20
+Create Date: 2026-10-18 14:21:37.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1d4e6a2c73'
+down_revision: Union[str, Sequence[str], None] = '3c5e8a1f7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_lessons_student_id_start_time', 'lessons', ['student_id', 'start_time'], unique=False)
+    op.create_index('ix_lessons_group_id_start_time', 'lessons', ['group_id', 'start_time'], unique=False)
+    op.create_index('ix_group_students_student_id', 'group_students', ['student_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_group_students_student_id', table_name='group_students')
+    op.drop_index('ix_lessons_group_id_start_time', table_name='lessons')
+    op.drop_index('ix_lessons_student_id_start_time', table_name='lessons')
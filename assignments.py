@@ -0,0 +1,38 @@
+import datetime
+from sqlalchemy import insert
+from .models import HomeworkAssignment, HomeworkSubmission
+
+
+async def create_assignment(db, homework_id, target_type, student_ids, deadline, target_id=None):
+    """
+    Создаёт назначение и по строке HomeworkSubmission на каждого ученика.
+    Сдачи вставляются одним INSERT ... RETURNING (executemany),
+    коммит — на вызывающей стороне, одной транзакцией.
+    Дедлайн уже прошёл — сдачи сразу overdue: планировщик смотрит
+    только дедлайны после своего прошлого прохода.
+    Возвращает (assignment_id, [(submission_id, student_id), ...]).
+    """
+    assignment_id = await db.scalar(
+        insert(HomeworkAssignment)
+        .values(
+            homework_id=homework_id,
+            assigned_to_type=target_type,
+            assigned_to_id=target_id,
+            assigned_to_ids=list(student_ids) if target_type == "multi" else None,
+            deadline=deadline,
+        )
+        .returning(HomeworkAssignment.id)
+    )
+
+    if not student_ids:
+        return assignment_id, []
+
+    status = "overdue" if deadline <= datetime.datetime.utcnow() else "assigned"
+    rows = await db.execute(
+        insert(HomeworkSubmission).returning(HomeworkSubmission.id, HomeworkSubmission.student_id),
+        [
+            {"assignment_id": assignment_id, "student_id": student_id, "status": status}
+            for student_id in student_ids
+        ],
+    )
+    return assignment_id, [tuple(r) for r in rows]
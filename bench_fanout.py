@@ -0,0 +1,93 @@
+"""
+Замер раздачи ДЗ группе: старый путь через ORM (commit + refresh +
+db.add на каждого ученика) против create_assignment (один INSERT ... RETURNING).
+
+    python -m app.bench_fanout
+    BENCH_DATABASE_URL=postgresql://postgres:postgres@db:5432/bench python -m app.bench_fanout
+
+Без BENCH_DATABASE_URL используется временный SQLite-файл (aiosqlite из requirements-dev.txt).
+Для Postgres указывайте отдельную пустую базу — таблицы создаются и наполняются.
+"""
+import os
+import asyncio
+import datetime
+import statistics
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp()
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{_tmp_dir}/bench.db"
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from .db import Base, make_async_url
+from .models import Teacher, Student, Homework, HomeworkAssignment, HomeworkSubmission
+from .assignments import create_assignment
+
+SIZES = (10, 100, 1000)
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+
+async def fanout_orm(db, homework_id, student_ids, deadline):
+    assignment = HomeworkAssignment(
+        homework_id=homework_id,
+        assigned_to_type="group",
+        deadline=deadline
+    )
+    db.add(assignment)
+    await db.commit()
+    await db.refresh(assignment)
+
+    for student_id in student_ids:
+        db.add(HomeworkSubmission(
+            assignment_id=assignment.id,
+            student_id=student_id,
+            status="assigned"
+        ))
+    await db.commit()
+
+
+async def fanout_bulk(db, homework_id, student_ids, deadline):
+    await create_assignment(db, homework_id, "group", student_ids, deadline)
+    await db.commit()
+
+
+async def seed(Session, size):
+    async with Session() as db:
+        teacher = Teacher(telegram_id=f"bench-{size}-{time.time_ns()}", name="bench")
+        db.add(teacher)
+        await db.flush()
+        students = [Student(name=f"S{i}", teacher_id=teacher.id) for i in range(size)]
+        db.add_all(students)
+        hw = Homework(teacher_id=teacher.id, title="bench")
+        db.add(hw)
+        await db.commit()
+        return hw.id, [s.id for s in students]
+
+
+async def main():
+    engine = create_async_engine(make_async_url(BENCH_DATABASE_URL))
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    deadline = datetime.datetime.utcnow() + datetime.timedelta(days=7)
+    print(f"{'students':>8} | {'orm, ms':>10} | {'bulk, ms':>10} | {'speedup':>7}")
+    for size in SIZES:
+        homework_id, student_ids = await seed(Session, size)
+        timings = {}
+        for name, fanout in (("orm", fanout_orm), ("bulk", fanout_bulk)):
+            samples = []
+            for _ in range(REPEATS):
+                async with Session() as db:
+                    started = time.perf_counter()
+                    await fanout(db, homework_id, student_ids, deadline)
+                    samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(samples)
+        print(f"{size:>8} | {timings['orm']:>10.1f} | {timings['bulk']:>10.1f} | {timings['orm'] / timings['bulk']:>6.1f}x")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
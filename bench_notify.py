@@ -0,0 +1,88 @@
+"""
+Прогон очереди уведомлений против локального фейкового Bot API.
+Сервер отвечает 429 (retry_after), если бот превысил FAKE_API_LIMIT
+сообщений в секунду — так видно и пропускную способность, и откат.
+
+    python -m app.bench_notify
+    BENCH_MESSAGES=2000 BENCH_CHATS=500 NOTIFY_GLOBAL_RATE=40 python -m app.bench_notify
+"""
+import os
+import asyncio
+import datetime
+import time
+
+os.environ.setdefault("NOTIFY_QUEUE", "memory")
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from .notifications import make_notification_queue
+
+BENCH_MESSAGES = int(os.getenv("BENCH_MESSAGES", "500"))
+BENCH_CHATS = int(os.getenv("BENCH_CHATS", "200"))
+FAKE_API_LIMIT = int(os.getenv("FAKE_API_LIMIT", "30"))
+FAKE_API_PORT = int(os.getenv("FAKE_API_PORT", "8081"))
+TOKEN = "123456:bench"
+
+
+class FakeBotAPI:
+    def __init__(self, limit):
+        self.limit = limit
+        self.window = []
+        self.delivered = 0
+        self.rejected = 0
+
+    async def handle(self, request):
+        now = time.monotonic()
+        self.window = [t for t in self.window if now - t < 1]
+        if len(self.window) >= self.limit:
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+
+        self.window.append(now)
+        self.delivered += 1
+        data = await request.post()
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.delivered,
+            "date": int(datetime.datetime.now().timestamp()),
+            "chat": {"id": int(data["chat_id"]), "type": "private"},
+            "text": data.get("text", ""),
+        }})
+
+
+async def main():
+    api = FakeBotAPI(FAKE_API_LIMIT)
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/sendMessage", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", FAKE_API_PORT).start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{FAKE_API_PORT}"))
+    bot = Bot(TOKEN, session=session)
+    queue = make_notification_queue()
+
+    for i in range(BENCH_MESSAGES):
+        await queue.put(1000 + i % BENCH_CHATS, f"Сообщение {i}")
+
+    started = time.perf_counter()
+    queue.start(bot)
+    while queue.sent + queue.failed < BENCH_MESSAGES:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    await bot.session.close()
+    await runner.cleanup()
+
+    print(f"{BENCH_MESSAGES} сообщений в {BENCH_CHATS} чатов за {elapsed:.1f} с "
+          f"({queue.sent / elapsed:.1f} msg/s)")
+    print(f"доставлено {queue.sent}, потеряно {queue.failed}, ответов 429: {api.rejected}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
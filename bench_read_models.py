@@ -0,0 +1,100 @@
+"""
+Гидратация списка ДЗ библиотеки: ORM-сущности Homework против строк
+read_models (Core select + dataclass со __slots__). Для сравнения —
+голые Row из того же select. Время — медиана, память — пик tracemalloc
+с учётом самого результата.
+
+    python -m app.bench_read_models
+    BENCH_ROWS=100000 BENCH_DATABASE_URL=postgresql://postgres:postgres@db:5432/bench python -m app.bench_read_models
+
+Без BENCH_DATABASE_URL используется временный SQLite-файл (aiosqlite из requirements-dev.txt).
+Для Postgres указывайте отдельную пустую базу — таблицы создаются и наполняются.
+"""
+import os
+import asyncio
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+_tmp_dir = tempfile.mkdtemp()
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{_tmp_dir}/bench.db"
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from .db import Base, make_async_url
+from .models import Teacher, Homework
+from .read_models import library_page
+
+BENCH_ROWS = int(os.getenv("BENCH_ROWS", "10000"))
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+
+async def load_orm(db, teacher_id):
+    return (await db.scalars(
+        select(Homework)
+        .filter(Homework.teacher_id == teacher_id, Homework.saved_in_library.is_(True))
+        .order_by(Homework.id)
+        .limit(BENCH_ROWS)
+    )).all()
+
+
+async def load_rows(db, teacher_id):
+    return (await db.execute(
+        select(Homework.id, Homework.title, Homework.content)
+        .filter(Homework.teacher_id == teacher_id, Homework.saved_in_library.is_(True))
+        .order_by(Homework.id)
+        .limit(BENCH_ROWS)
+    )).all()
+
+
+async def load_read_model(db, teacher_id):
+    return (await library_page(db, teacher_id, limit=BENCH_ROWS)).rows
+
+
+async def seed(Session):
+    async with Session() as db:
+        teacher = Teacher(telegram_id=f"bench-read-{time.time_ns()}", name="bench")
+        db.add(teacher)
+        await db.flush()
+        await db.execute(insert(Homework), [
+            {"teacher_id": teacher.id, "title": f"ДЗ {i}", "content": f"Задачи {i}-{i + 10}", "saved_in_library": True}
+            for i in range(BENCH_ROWS)
+        ])
+        await db.commit()
+        return teacher.id
+
+
+async def main():
+    engine = create_async_engine(make_async_url(BENCH_DATABASE_URL))
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    teacher_id = await seed(Session)
+
+    print(f"{BENCH_ROWS} строк")
+    print(f"{'loader':>10} | {'ms':>8} | {'peak, KB':>9}")
+    for name, load in (("orm", load_orm), ("row", load_rows), ("read", load_read_model)):
+        samples = []
+        for _ in range(REPEATS):
+            async with Session() as db:
+                started = time.perf_counter()
+                rows = await load(db, teacher_id)
+                samples.append((time.perf_counter() - started) * 1000)
+            assert len(rows) == BENCH_ROWS
+
+        async with Session() as db:
+            tracemalloc.start()
+            rows = await load(db, teacher_id)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        del rows
+
+        print(f"{name:>10} | {statistics.median(samples):>8.1f} | {peak / 1024:>9.0f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,13 +8,33 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram_calendar.simple_calendar import SimpleCalendar, SimpleCalendarCallback
-from aiogram.fsm.storage.memory import MemoryStorage
-from .db import SessionLocal
+from sqlalchemy import select, insert, update, and_, func, case, null, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, joinedload, contains_eager
+from .cache import TTLCache
+from .db import AsyncSessionLocal
+from .fsm_storage import make_fsm_storage
+from .middlewares import IdentityMiddleware, MetricsMiddleware, HandlerNameMiddleware, invalidate_identity
+from .assignments import create_assignment
+from .ledger import LEDGER_KINDS, add_entries, get_balance
+from .lessons import (
+    LESSON_DURATION, LESSON_MAX_DURATION, LESSON_SERIES_MAX,
+    expand_occurrences, series_last_date, find_conflicts, create_lessons, debit_lesson
+)
+from .notifications import notify, setup_notifications, start_broadcast
+from .read_models import groups_page, library_page, assignments_page, balances_page, children
+from .scheduler import setup_scheduler
+from .sql_debug import query_budget
+from .submission_store import store_telegram_file, SubmissionTooLarge, MAX_SUBMISSION_SIZE
+from .pagination import (
+    PageCallback, fetch_page, page_keyboard,
+    encode_cursor, decode_id_cursor, decode_dt_id_cursor
+)
 # <--- Добавлены новые модели в импорт
 from .models import (
     Teacher, Student, Group, GroupStudent, Lesson,
     Homework, HomeworkAssignment, HomeworkSubmission,
-    Parent, ParentStudent, SaaSPayment, StudentPayment
+    Parent, ParentStudent, SaaSPayment, StudentPayment, LedgerEntry
 )
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -22,7 +42,21 @@ if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set in environment")
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=make_fsm_storage())
+dp.update.outer_middleware(MetricsMiddleware())
+dp.message.middleware(IdentityMiddleware())
+dp.callback_query.middleware(IdentityMiddleware())
+dp.message.middleware(HandlerNameMiddleware())
+dp.callback_query.middleware(HandlerNameMiddleware())
+setup_notifications(dp)
+setup_scheduler(dp)
+
+# Готовый текст отчёта родителя по parent.id; сбрасывается при оценке и привязке ребёнка
+parent_report_cache = TTLCache(
+    maxsize=int(os.getenv("PARENT_REPORT_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("PARENT_REPORT_CACHE_TTL", "120")),
+)
+PARENT_REPORT_LAST = 5
 
 
 # ======= Клавиатуры =======
@@ -79,44 +113,44 @@ async def cmd_start(message: types.Message):
 
 # ===== Регистрация Учителя =====
 @dp.message(Command("register_teacher"))
-async def register_teacher(message: types.Message):
+async def register_teacher(message: types.Message, teacher: Teacher | None):
     tg_id = str(message.from_user.id)
     name = message.from_user.full_name
 
-    with SessionLocal() as db:
-        t = db.query(Teacher).filter_by(telegram_id=tg_id).first()
-        if t:
-            await message.answer("Вы уже зарегистрированы как преподаватель.")
-            return
+    if teacher:
+        await message.answer("Вы уже зарегистрированы как преподаватель.")
+        return
 
+    async with AsyncSessionLocal() as db:
         teacher = Teacher(telegram_id=tg_id, name=name)
         db.add(teacher)
-        db.commit()
+        await db.commit()
 
+    invalidate_identity(tg_id)
     await message.answer("✅ Вы зарегистрированы как преподаватель.", reply_markup=MAIN_KB)
 
 
 # ===== Регистрация Родителя (НОВОЕ) =====
 @dp.message(Command("register_parent"))
-async def register_parent(message: types.Message):
+async def register_parent(message: types.Message, teacher: Teacher | None, parent: Parent | None):
     tg_id = str(message.from_user.id)
     name = message.from_user.full_name
 
-    with SessionLocal() as db:
-        # Проверяем, не учитель ли это (опционально)
-        if db.query(Teacher).filter_by(telegram_id=tg_id).first():
-            await message.answer("Вы уже зарегистрированы как учитель.")
-            return
+    # Проверяем, не учитель ли это (опционально)
+    if teacher:
+        await message.answer("Вы уже зарегистрированы как учитель.")
+        return
 
-        parent = db.query(Parent).filter_by(telegram_id=tg_id).first()
-        if parent:
-            await message.answer("Вы уже зарегистрированы как Родитель.")
-            return
+    if parent:
+        await message.answer("Вы уже зарегистрированы как Родитель.")
+        return
 
+    async with AsyncSessionLocal() as db:
         parent = Parent(telegram_id=tg_id, name=name)
         db.add(parent)
-        db.commit()
+        await db.commit()
 
+    invalidate_identity(tg_id)
     await message.answer(
         "👨‍👩‍👧 Вы зарегистрированы как Родитель.\n"
         "Чтобы привязать ребенка, узнайте его ID у учителя и введите команду:\n"
@@ -127,7 +161,7 @@ async def register_parent(message: types.Message):
 
 # ===== Привязка ребенка родителем (НОВОЕ) =====
 @dp.message(Command("link_child"))
-async def link_child(message: types.Message):
+async def link_child(message: types.Message, parent: Parent | None):
     # Ожидаем формат: /link_child 123
     args = message.text.split()
     if len(args) != 2 or not args[1].isdigit():
@@ -135,67 +169,67 @@ async def link_child(message: types.Message):
         return
 
     student_id = int(args[1])
-    parent_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        parent = db.query(Parent).filter_by(telegram_id=parent_tg).first()
-        if not parent:
-            await message.answer("Сначала зарегистрируйтесь: /register_parent")
-            return
+    if not parent:
+        await message.answer("Сначала зарегистрируйтесь: /register_parent")
+        return
 
-        student = db.query(Student).filter_by(id=student_id).first()
+    async with AsyncSessionLocal() as db:
+        student = await db.scalar(select(Student).filter_by(id=student_id))
         if not student:
             await message.answer("❌ Ученик с таким ID не найден.")
             return
 
-        # Проверка дублей
-        link = db.query(ParentStudent).filter_by(parent_id=parent.id, student_id=student.id).first()
-        if link:
-            await message.answer("⚠️ Этот ученик уже привязан к вам.")
-            return
-
+        # Дубли отсекает уникальный индекс (parent_id, student_id)
         new_link = ParentStudent(parent_id=parent.id, student_id=student.id)
         db.add(new_link)
-        db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            await message.answer("⚠️ Этот ученик уже привязан к вам.")
+            return
+        parent_report_cache.pop(parent.id)
 
         await message.answer(f"✅ Ученик {student.name} успешно привязан! Теперь вы видите его прогресс.")
 
 
 # ===== SaaS: Меню подписки (НОВОЕ) =====
 @dp.message(F.text == "💳 Подписка")
-async def subscription_menu(message: types.Message):
-    tg_id = str(message.from_user.id)
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=tg_id).first()
-        if not teacher:
-            await message.answer("Эта функция только для учителей.")
-            return
-        
-        plan = teacher.subscription_plan
-        end_date = teacher.subscription_end_date
-        
-        info = f"💎 Ваш тариф: <b>{plan}</b>\n"
-        if end_date:
-            info += f"⏳ Действует до: {end_date.strftime('%d.%m.%Y')}\n"
-        else:
-            info += "⏳ Срок действия: Бессрочно (FREE)\n"
+async def subscription_menu(message: types.Message, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Эта функция только для учителей.")
+        return
 
-        if plan == "FREE":
-            info += "\n🚀 Перейдите на PRO, чтобы получить больше возможностей!"
+    # Тариф — из базы: кэш роли на другой реплике может помнить его до покупки
+    async with AsyncSessionLocal() as db:
+        plan, end_date = (await db.execute(
+            select(Teacher.subscription_plan, Teacher.subscription_end_date).filter_by(id=teacher.id)
+        )).one()
+    
+    info = f"💎 Ваш тариф: <b>{plan}</b>\n"
+    if end_date:
+        info += f"⏳ Действует до: {end_date.strftime('%d.%m.%Y')}\n"
+    else:
+        info += "⏳ Срок действия: Бессрочно (FREE)\n"
+
+    if plan == "FREE":
+        info += "\n🚀 Перейдите на PRO, чтобы получить больше возможностей!"
 
-        await message.answer(info, parse_mode="HTML", reply_markup=PAYMENT_KB)
+    await message.answer(info, parse_mode="HTML", reply_markup=PAYMENT_KB)
 
 
 # ===== SaaS: Симуляция оплаты (НОВОЕ) =====
 @dp.message(F.text == "💳 Купить PRO (Тест)")
-async def simulate_payment(message: types.Message):
-    tg_id = str(message.from_user.id)
+async def simulate_payment(message: types.Message, teacher: Teacher | None):
     amount = 1000 # Цена PRO
     
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=tg_id).first()
-        if not teacher:
-            return
+    if not teacher:
+        return
+
+    async with AsyncSessionLocal() as db:
+        # Строка из кэша только для чтения — перечитываем учителя для записи
+        teacher = await db.get(Teacher, teacher.id)
 
         # 1. Создаем запись о платеже
         payment_id = str(uuid.uuid4())
@@ -206,8 +240,8 @@ async def simulate_payment(message: types.Message):
             status="pending"
         )
         db.add(payment)
-        db.commit()
-        db.refresh(payment)
+        await db.commit()
+        await db.refresh(payment)
 
         # 2. СИМУЛЯЦИЯ: Сразу меняем статус на success
         payment.status = "succeeded"
@@ -222,9 +256,11 @@ async def simulate_payment(message: types.Message):
         else:
             teacher.subscription_end_date = now + datetime.timedelta(days=30)
             
-        db.commit()
+        await db.commit()
         end_date_str = teacher.subscription_end_date.strftime('%d.%m.%Y')
 
+    invalidate_identity(teacher.telegram_id)
+
     await message.answer(
         f"✅ Оплата прошла успешно (Симуляция)!\n"
         f"🎉 Тариф PRO активирован до {end_date_str}",
@@ -238,18 +274,16 @@ class AddStudent(StatesGroup):
 
 
 @dp.message(F.text == "➕ Добавить ученика")
-async def btn_add_student(message: types.Message, state: FSMContext):
-    teacher_tg = str(message.from_user.id)
-
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь: /register_teacher")
-            return
+async def btn_add_student(message: types.Message, state: FSMContext, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+        return
 
-        if check_plan_limit(teacher, "students"):
-            limits = PLAN_LIMITS[teacher.subscription_plan]
-            await message.answer(f"❌ Лимит учеников на тарифе {teacher.subscription_plan}: {limits['students']}")
+    async with AsyncSessionLocal() as db:
+        exceeded = await check_plan_limit(db, teacher, "students")
+        if exceeded:
+            plan, limit = exceeded
+            await message.answer(f"❌ Лимит учеников на тарифе {plan}: {limit}")
             return
 
     await message.answer("Введите ФИО ученика:", reply_markup=BACK_KB)
@@ -257,21 +291,28 @@ async def btn_add_student(message: types.Message, state: FSMContext):
 
 
 @dp.message(AddStudent.waiting_for_name)
-async def process_student_name(message: types.Message, state: FSMContext):
+async def process_student_name(message: types.Message, state: FSMContext, teacher: Teacher | None):
     name = message.text.strip()
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+        await state.clear()
+        return
+
+    async with AsyncSessionLocal() as db:
+        # Повторная проверка под блокировкой строки учителя — два параллельных
+        # добавления не смогут вместе превысить лимит тарифа
+        exceeded = await check_plan_limit(db, teacher, "students", for_update=True)
+        if exceeded:
+            plan, limit = exceeded
+            await message.answer(f"❌ Лимит учеников на тарифе {plan}: {limit}", reply_markup=MAIN_KB)
             await state.clear()
             return
 
         student = Student(name=name, teacher_id=teacher.id)
         db.add(student)
-        db.commit()
-        db.refresh(student)
+        await db.commit()
+        await db.refresh(student)
 
     await message.answer(f"👨‍🎓 Ученик {name} добавлен 🎉\n🆔 ID ученика: {student.id} (передайте его родителю для привязки)", reply_markup=MAIN_KB)
     await state.clear()
@@ -288,30 +329,46 @@ PLAN_LIMITS = {
     "PREMIUM": {"students": 100, "groups": 50}
 }
 
-def check_plan_limit(teacher, limit_type):
-    plan = teacher.subscription_plan
-    limits = PLAN_LIMITS.get(plan, {"students": 0, "groups": 0})
+PLAN_LIMIT_MODELS = {"students": Student, "groups": Group}
+
+async def check_plan_limit(db, teacher, limit_type, for_update=False):
+    """
+    (тариф, лимит), если лимит исчерпан, иначе None. Тариф читается из базы
+    вместе с COUNT(*), а не из кэша роли: после оплаты на другой реплике
+    кэш помнит старый тариф до IDENTITY_CACHE_TTL.
+    for_update=True блокирует строку учителя до конца транзакции:
+    вызывать в той же сессии, где потом вставляется запись.
+    """
+    model = PLAN_LIMIT_MODELS.get(limit_type)
+    if model is None:
+        return None
+
+    count = select(func.count()).select_from(model).filter(model.teacher_id == teacher.id).scalar_subquery()
+    if for_update:
+        # Сначала блокировка, потом подсчёт: COUNT в одном запросе с FOR UPDATE
+        # видел бы снимок до ожидания блокировки
+        plan = await db.scalar(
+            select(Teacher.subscription_plan).filter_by(id=teacher.id).with_for_update()
+        )
+        used = await db.scalar(select(count))
+    else:
+        plan, used = (await db.execute(select(Teacher.subscription_plan, count).filter_by(id=teacher.id))).one()
 
-    if limit_type == "students":
-        return len(teacher.students) >= limits["students"]
-    elif limit_type == "groups":
-        return len(teacher.groups) >= limits["groups"]
-    return False
+    limit = PLAN_LIMITS.get(plan, {"students": 0, "groups": 0})[limit_type]
+    return (plan, limit) if used >= limit else None
 
 
 @dp.message(F.text == "👥 Создать группу")
-async def btn_create_group(message: types.Message, state: FSMContext):
-    teacher_tg = str(message.from_user.id)
-
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь: /register_teacher")
-            return
+async def btn_create_group(message: types.Message, state: FSMContext, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+        return
 
-        if check_plan_limit(teacher, "groups"):
-            limits = PLAN_LIMITS[teacher.subscription_plan]
-            await message.answer(f"❌ Лимит групп на тарифе {teacher.subscription_plan}: {limits['groups']}")
+    async with AsyncSessionLocal() as db:
+        exceeded = await check_plan_limit(db, teacher, "groups")
+        if exceeded:
+            plan, limit = exceeded
+            await message.answer(f"❌ Лимит групп на тарифе {plan}: {limit}")
             return
 
     await message.answer("Введите название группы:", reply_markup=BACK_KB)
@@ -319,28 +376,33 @@ async def btn_create_group(message: types.Message, state: FSMContext):
 
 
 @dp.message(CreateGroup.waiting_for_title)
-async def process_group_title(message: types.Message, state: FSMContext):
+async def process_group_title(message: types.Message, state: FSMContext, teacher: Teacher | None):
     title = message.text.strip()
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь: /register_teacher")
+        await state.clear()
+        return
+
+    async with AsyncSessionLocal() as db:
+        exceeded = await check_plan_limit(db, teacher, "groups", for_update=True)
+        if exceeded:
+            plan, limit = exceeded
+            await message.answer(f"❌ Лимит групп на тарифе {plan}: {limit}", reply_markup=MAIN_KB)
             await state.clear()
             return
 
         group = Group(title=title, teacher_id=teacher.id)
         db.add(group)
-        db.commit()
-        db.refresh(group)
+        await db.commit()
+        await db.refresh(group)
 
     await message.answer(f"👥 Группа '{title}' создана ✅\n🆔 ID: {group.id}\n\nДобавляйте учеников командой: /add_to_group <ID_группы> <ID_ученика>", reply_markup=MAIN_KB)
     await state.clear()
 
 
 @dp.message(Command("add_to_group"))
-async def add_student_to_group(message: types.Message):
+async def add_student_to_group(message: types.Message, teacher: Teacher | None):
     args = message.text.split()
     if len(args) != 3 or not args[1].isdigit() or not args[2].isdigit():
         await message.answer("Использование: /add_to_group <ID_группы> <ID_ученика>")
@@ -348,38 +410,37 @@ async def add_student_to_group(message: types.Message):
 
     group_id = int(args[1])
     student_id = int(args[2])
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-        group = db.query(Group).filter_by(id=group_id, teacher_id=teacher.id).first()
+    async with AsyncSessionLocal() as db:
+        group = await db.scalar(select(Group).filter_by(id=group_id, teacher_id=teacher.id))
         if not group:
             await message.answer("❌ Группа не найдена или не ваша.")
             return
 
-        student = db.query(Student).filter_by(id=student_id, teacher_id=teacher.id).first()
+        student = await db.scalar(select(Student).filter_by(id=student_id, teacher_id=teacher.id))
         if not student:
             await message.answer("❌ Ученик не найден или не ваш.")
             return
 
-        existing = db.query(GroupStudent).filter_by(group_id=group_id, student_id=student_id).first()
-        if existing:
-            await message.answer("⚠️ Ученик уже в группе.")
-            return
-
+        # Дубли отсекает уникальный индекс (group_id, student_id)
         link = GroupStudent(group_id=group_id, student_id=student_id)
         db.add(link)
-        db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            await message.answer("⚠️ Ученик уже в группе.")
+            return
 
     await message.answer(f"✅ {student.name} добавлен в группу {group.title}")
 
 
 @dp.message(Command("remove_from_group"))
-async def remove_student_from_group(message: types.Message):
+async def remove_student_from_group(message: types.Message, teacher: Teacher | None):
     args = message.text.split()
     if len(args) != 3 or not args[1].isdigit() or not args[2].isdigit():
         await message.answer("Использование: /remove_from_group <ID_группы> <ID_ученика>")
@@ -387,57 +448,66 @@ async def remove_student_from_group(message: types.Message):
 
     group_id = int(args[1])
     student_id = int(args[2])
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-        group = db.query(Group).filter_by(id=group_id, teacher_id=teacher.id).first()
+    async with AsyncSessionLocal() as db:
+        group = await db.scalar(select(Group).filter_by(id=group_id, teacher_id=teacher.id))
         if not group:
             await message.answer("❌ Группа не найдена.")
             return
 
-        link = db.query(GroupStudent).filter_by(group_id=group_id, student_id=student_id).first()
+        link = await db.scalar(
+            select(GroupStudent)
+            .filter_by(group_id=group_id, student_id=student_id)
+            .options(selectinload(GroupStudent.student))
+        )
         if not link:
             await message.answer("❌ Ученик не в этой группе.")
             return
 
         student_name = link.student.name
-        db.delete(link)
-        db.commit()
+        await db.delete(link)
+        await db.commit()
 
     await message.answer(f"✅ {student_name} удалён из группы {group.title}")
 
 
 @dp.message(Command("list_groups"))
-async def list_groups(message: types.Message):
-    teacher_tg = str(message.from_user.id)
+@query_budget(2)
+async def list_groups(message: types.Message, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_groups_page(db, teacher)
 
-        groups = teacher.groups
-        if not groups:
-            await message.answer("У вас нет групп.", reply_markup=MAIN_KB)
-            return
+    if text is None:
+        await message.answer("У вас нет групп.", reply_markup=MAIN_KB)
+        return
 
-        text = "<b>👥 Ваши группы:</b>\n\n"
-        for g in groups:
-            count = len(g.students)
-            text += f"<b>{g.title}</b> (ID: {g.id})\n"
-            text += f"   👨‍🎓 Учеников: {count}\n"
-            if g.students:
-                for gs in g.students:
-                    text += f"      • {gs.student.name}\n"
-            text += "\n"
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or MAIN_KB)
+
+
+async def render_groups_page(db, teacher, cursor=None, back=False):
+    page = await groups_page(db, teacher.id, decode_id_cursor(cursor) if cursor else None, back)
+    if not page.rows:
+        return None, None
+
+    text = "<b>👥 Ваши группы:</b>\n\n"
+    for g in page.rows:
+        text += f"<b>{g.title}</b> (ID: {g.id})\n"
+        text += f"   👨‍🎓 Учеников: {g.member_count}\n"
+        for name in g.members:
+            text += f"      • {name[:50] + '...' if len(name) > 50 else name}\n"
+        if g.member_count > len(g.members):
+            text += f"      … и ещё {g.member_count - len(g.members)}\n"
+        text += "\n"
 
-        await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
+    return text, page_keyboard("groups", page, lambda g: encode_cursor(g.id))
 
 
 # ===== Урок =====
@@ -445,6 +515,10 @@ class ScheduleLesson(StatesGroup):
     waiting_for_date = State()
     waiting_for_time = State()
     waiting_for_topic = State()
+    waiting_for_target_type = State()
+    waiting_for_target_id = State()
+    waiting_for_repeat = State()
+    waiting_for_until = State()
 
 @dp.message(F.text == "📅 Назначить урок")
 async def btn_schedule(message: types.Message, state: FSMContext):
@@ -461,7 +535,7 @@ async def calendar_handler(callback: types.CallbackQuery, callback_data: SimpleC
     if selected:
         await state.update_data(date=date.strftime("%Y-%m-%d"))
         await callback.message.answer(f"Дата выбрана: {date.strftime('%Y-%m-%d')}")
-        await callback.message.answer("Введите время (HH:MM):")
+        await callback.message.answer(f"Введите время (HH:MM), можно с длительностью в минутах: 18:00 90\nПо умолчанию {LESSON_DURATION} мин.")
         await state.set_state(ScheduleLesson.waiting_for_time)
 
 @dp.message(ScheduleLesson.waiting_for_time)
@@ -475,36 +549,226 @@ async def lesson_time(message: types.Message, state: FSMContext):
 async def lesson_topic(message: types.Message, state: FSMContext):
     data = await state.get_data()
 
+    time_parts = data["time"].split()
     try:
         dt = datetime.datetime.strptime(
-            f"{data['date']} {data['time']}",
+            f"{data['date']} {time_parts[0]}",
             "%Y-%m-%d %H:%M"
         )
+        duration = int(time_parts[1]) if len(time_parts) > 1 else LESSON_DURATION
     except:
         await message.answer("❌ Неверный формат.", reply_markup=MAIN_KB)
         await state.clear()
         return
 
-    teacher_tg = str(message.from_user.id)
+    if not 0 < duration <= LESSON_MAX_DURATION:
+        await message.answer(f"❌ Длительность — от 1 до {LESSON_MAX_DURATION} минут.", reply_markup=MAIN_KB)
+        await state.clear()
+        return
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
-            await state.clear()
-            return
+    await state.update_data(start_time=dt.isoformat(), duration=duration, topic=message.text.strip())
+    kb = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="👤 Ученику"), KeyboardButton(text="👥 Группе")],
+            [KeyboardButton(text="⬅️ Назад")]
+        ],
+        resize_keyboard=True
+    )
+    await message.answer("Для кого урок?", reply_markup=kb)
+    await state.set_state(ScheduleLesson.waiting_for_target_type)
 
-        lesson = Lesson(
-            teacher_id=teacher.id,
-            topic=message.text.strip(),
-            start_time=dt
+
+@dp.message(ScheduleLesson.waiting_for_target_type)
+async def lesson_target_type(message: types.Message, state: FSMContext):
+    target_type = message.text.strip()
+
+    if target_type == "👤 Ученику":
+        await message.answer("Введите ID ученика:", reply_markup=BACK_KB)
+        await state.update_data(target_type="student")
+    elif target_type == "👥 Группе":
+        await message.answer("Введите ID группы:", reply_markup=BACK_KB)
+        await state.update_data(target_type="group")
+    else:
+        await message.answer("Выберите из предложенного.")
+        return
+
+    await state.set_state(ScheduleLesson.waiting_for_target_id)
+
+
+@dp.message(ScheduleLesson.waiting_for_target_id)
+async def lesson_target_id(message: types.Message, state: FSMContext, teacher: Teacher | None):
+    text = message.text.strip()
+    if not text.isdigit():
+        await message.answer("Введите число.")
+        return
+
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        await state.clear()
+        return
+
+    data = await state.get_data()
+    async with AsyncSessionLocal() as db:
+        if data["target_type"] == "student":
+            target_id = await db.scalar(select(Student.id).filter_by(id=int(text), teacher_id=teacher.id))
+            if target_id is None:
+                await message.answer("❌ Ученик не найден.", reply_markup=MAIN_KB)
+                await state.clear()
+                return
+        else:
+            target_id = await db.scalar(select(Group.id).filter_by(id=int(text), teacher_id=teacher.id))
+            if target_id is None:
+                await message.answer("❌ Группа не найдена.", reply_markup=MAIN_KB)
+                await state.clear()
+                return
+
+    await state.update_data(target_id=target_id)
+    kb = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="1️⃣ Один раз")],
+            [KeyboardButton(text="🔁 Каждую неделю"), KeyboardButton(text="🔁 Раз в 2 недели")],
+            [KeyboardButton(text="⬅️ Назад")]
+        ],
+        resize_keyboard=True
+    )
+    await message.answer("Повторять урок?", reply_markup=kb)
+    await state.set_state(ScheduleLesson.waiting_for_repeat)
+
+
+LESSON_REPEATS = {"🔁 Каждую неделю": 7, "🔁 Раз в 2 недели": 14}
+
+
+@dp.message(ScheduleLesson.waiting_for_repeat)
+async def lesson_repeat(message: types.Message, state: FSMContext, teacher: Teacher | None):
+    choice = message.text.strip()
+
+    if choice == "1️⃣ Один раз":
+        await save_lessons(message, state, teacher)
+        return
+
+    if choice not in LESSON_REPEATS:
+        await message.answer("Выберите из предложенного.")
+        return
+
+    await state.update_data(every_days=LESSON_REPEATS[choice])
+    await message.answer("До какой даты повторять? (YYYY-MM-DD)", reply_markup=BACK_KB)
+    await state.set_state(ScheduleLesson.waiting_for_until)
+
+
+@dp.message(ScheduleLesson.waiting_for_until)
+async def lesson_until(message: types.Message, state: FSMContext, teacher: Teacher | None):
+    try:
+        until = datetime.datetime.strptime(message.text.strip(), "%Y-%m-%d").date()
+    except ValueError:
+        await message.answer("❌ Неверный формат. Используйте YYYY-MM-DD")
+        return
+
+    data = await state.get_data()
+    last = series_last_date(datetime.datetime.fromisoformat(data["start_time"]), data["every_days"])
+    if until > last:
+        await message.answer(
+            f"❌ В серии не больше {LESSON_SERIES_MAX} уроков — повторять можно до {last.strftime('%Y-%m-%d')}.\n"
+            "Введите дату не позже неё:"
         )
-        db.add(lesson)
-        db.commit()
+        return
+
+    await save_lessons(message, state, teacher, until)
+
 
-    await message.answer("📅 Урок назначен!", reply_markup=MAIN_KB)
+async def save_lessons(message, state, teacher, until=None):
+    data = await state.get_data()
     await state.clear()
 
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        return
+
+    start = datetime.datetime.fromisoformat(data["start_time"])
+    occurrences = expand_occurrences(start, data.get("every_days") if until else None, until)
+    if not occurrences:
+        await message.answer("❌ Дата окончания раньше первого урока.", reply_markup=MAIN_KB)
+        return
+
+    async with AsyncSessionLocal() as db:
+        conflicts = await find_conflicts(db, teacher.id, occurrences, data["duration"])
+        if conflicts:
+            text = "❌ Время занято другими уроками:\n"
+            for lesson in conflicts[:10]:
+                text += f"🕒 {lesson.start_time.strftime('%d.%m.%Y %H:%M')} — {lesson.topic}\n"
+            await message.answer(text, reply_markup=MAIN_KB)
+            return
+
+        target = {"student_id": data["target_id"]} if data["target_type"] == "student" else {"group_id": data["target_id"]}
+        count = await create_lessons(db, teacher.id, data["topic"], occurrences, data["duration"], **target)
+        await db.commit()
+
+    if count == 1:
+        await message.answer("📅 Урок назначен!", reply_markup=MAIN_KB)
+    else:
+        await message.answer(
+            f"📅 Назначено уроков: {count}\n"
+            f"С {occurrences[0].strftime('%d.%m.%Y')} по {occurrences[-1].strftime('%d.%m.%Y')}, {occurrences[0].strftime('%H:%M')}",
+            reply_markup=MAIN_KB
+        )
+
+
+@dp.message(Command("lesson_held"))
+async def lesson_held(message: types.Message, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
+
+    args = message.text.split()
+    now = datetime.datetime.utcnow()
+
+    if len(args) == 1:
+        # Без ID — подсказка: начавшиеся сегодня и неотмеченные уроки
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        async with AsyncSessionLocal() as db:
+            lessons = (await db.execute(
+                select(Lesson.id, Lesson.start_time, Lesson.topic)
+                .filter(
+                    Lesson.teacher_id == teacher.id,
+                    Lesson.start_time >= day_start,
+                    Lesson.start_time <= now,
+                    Lesson.held_at.is_(None),
+                )
+                .order_by(Lesson.start_time)
+            )).all()
+        if not lessons:
+            await message.answer("Сегодня неотмеченных уроков нет.")
+            return
+        text = "<b>Уроки сегодня:</b>\n"
+        for lesson in lessons:
+            text += f"🆔 {lesson.id} — {lesson.start_time.strftime('%H:%M')} {lesson.topic}\n"
+        text += "\nОтметить проведённым: /lesson_held <ID_урока>"
+        await message.answer(text, parse_mode="HTML")
+        return
+
+    if len(args) != 2 or not args[1].isdigit():
+        await message.answer("Использование: /lesson_held <ID_урока>")
+        return
+
+    async with AsyncSessionLocal() as db:
+        lesson = await db.scalar(
+            select(Lesson).filter_by(id=int(args[1]), teacher_id=teacher.id).with_for_update()
+        )
+        if not lesson:
+            await message.answer("❌ Урок не найден.")
+            return
+        if lesson.held_at is not None:
+            await message.answer("ℹ️ Урок уже отмечен проведённым.")
+            return
+        # Как и автосписание, только начавшиеся уроки: иначе занятие спишется заранее
+        if lesson.start_time > now:
+            await message.answer(f"❌ Урок ещё не начался: {lesson.start_time.strftime('%d.%m.%Y %H:%M')}")
+            return
+
+        debited = await debit_lesson(db, lesson, now)
+        await db.commit()
+
+    await message.answer(f"✅ Урок «{lesson.topic}» проведён. Списано занятий: {len(debited)}")
+
 
 # ===== ДЗ: создание =======
 class CreateHomework(StatesGroup):
@@ -561,18 +825,16 @@ async def hw_score(message: types.Message, state: FSMContext):
 
 
 @dp.message(CreateHomework.waiting_for_saved_in_library)
-async def hw_save(message: types.Message, state: FSMContext):
+async def hw_save(message: types.Message, state: FSMContext, teacher: Teacher | None):
     saved = message.text.strip().lower() in ("yes", "y", "да")
     data = await state.get_data()
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала /register_teacher", reply_markup=MAIN_KB)
-            await state.clear()
-            return
+    if not teacher:
+        await message.answer("Сначала /register_teacher", reply_markup=MAIN_KB)
+        await state.clear()
+        return
 
+    async with AsyncSessionLocal() as db:
         hw = Homework(
             teacher_id=teacher.id,
             title=data["title"],
@@ -581,8 +843,8 @@ async def hw_save(message: types.Message, state: FSMContext):
             saved_in_library=saved
         )
         db.add(hw)
-        db.commit()
-        db.refresh(hw)
+        await db.commit()
+        await db.refresh(hw)
 
     text = f"✅ Домашка создана.\n🆔 ID: {hw.id}\n📚 В библиотеке: {'Да' if saved else 'Нет'}\n\n"
     text += "Назначить ДЗ командой: /assign_homework <ID_ДЗ>"
@@ -591,49 +853,54 @@ async def hw_save(message: types.Message, state: FSMContext):
 
 
 @dp.message(Command("library"))
-async def homework_library(message: types.Message):
-    teacher_tg = str(message.from_user.id)
+@query_budget(1)
+async def homework_library(message: types.Message, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_library_page(db, teacher)
 
-        homeworks = db.query(Homework).filter_by(teacher_id=teacher.id, saved_in_library=True).all()
-        if not homeworks:
-            await message.answer("Библиотека пуста.", reply_markup=MAIN_KB)
-            return
+    if text is None:
+        await message.answer("Библиотека пуста.", reply_markup=MAIN_KB)
+        return
 
-        text = "<b>📚 Библиотека ДЗ:</b>\n\n"
-        for hw in homeworks:
-            text += f"<b>{hw.title}</b> (ID: {hw.id})\n"
-            if hw.content:
-                preview = hw.content[:50] + "..." if len(hw.content) > 50 else hw.content
-                text += f"   {preview}\n"
-            text += "\n"
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or MAIN_KB)
 
-        text += "\nНазначить: /assign_homework <ID_ДЗ>"
-        await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
+
+async def render_library_page(db, teacher, cursor=None, back=False):
+    page = await library_page(db, teacher.id, decode_id_cursor(cursor) if cursor else None, back)
+    if not page.rows:
+        return None, None
+
+    text = "<b>📚 Библиотека ДЗ:</b>\n\n"
+    for hw in page.rows:
+        text += f"<b>{hw.title}</b> (ID: {hw.id})\n"
+        if hw.content:
+            preview = hw.content[:50] + "..." if len(hw.content) > 50 else hw.content
+            text += f"   {preview}\n"
+        text += "\n"
+
+    text += "\nНазначить: /assign_homework <ID_ДЗ>"
+    return text, page_keyboard("library", page, lambda hw: encode_cursor(hw.id))
 
 
 @dp.message(Command("assign_homework"))
-async def assign_homework_cmd(message: types.Message, state: FSMContext):
+async def assign_homework_cmd(message: types.Message, state: FSMContext, teacher: Teacher | None):
     args = message.text.split()
     if len(args) != 2 or not args[1].isdigit():
         await message.answer("Использование: /assign_homework <ID_ДЗ>")
         return
 
     hw_id = int(args[1])
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-        hw = db.query(Homework).filter_by(id=hw_id, teacher_id=teacher.id).first()
+    async with AsyncSessionLocal() as db:
+        hw = await db.scalar(select(Homework).filter_by(id=hw_id, teacher_id=teacher.id))
         if not hw:
             await message.answer("❌ ДЗ не найдено.")
             return
@@ -642,7 +909,7 @@ async def assign_homework_cmd(message: types.Message, state: FSMContext):
     kb = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="👤 Ученику"), KeyboardButton(text="👥 Группе")],
-            [KeyboardButton(text="⬅️ Назад")]
+            [KeyboardButton(text="👤👤 Нескольким ученикам"), KeyboardButton(text="⬅️ Назад")]
         ],
         resize_keyboard=True
     )
@@ -660,6 +927,9 @@ async def assign_target_type(message: types.Message, state: FSMContext):
     elif target_type == "👥 Группе":
         await message.answer("Введите ID группы:", reply_markup=BACK_KB)
         await state.update_data(target_type="group")
+    elif target_type == "👤👤 Нескольким ученикам":
+        await message.answer("Введите ID учеников через запятую:", reply_markup=BACK_KB)
+        await state.update_data(target_type="multi")
     else:
         await message.answer("Выберите из предложенного.")
         return
@@ -670,17 +940,46 @@ async def assign_target_type(message: types.Message, state: FSMContext):
 @dp.message(AssignHomework.waiting_for_target_id)
 async def assign_target_id(message: types.Message, state: FSMContext):
     text = message.text.strip()
-    if not text.isdigit():
+    data = await state.get_data()
+
+    if data.get("target_type") == "multi":
+        ids = [part.strip() for part in text.replace(" ", ",").split(",") if part.strip()]
+        if not ids or not all(i.isdigit() for i in ids):
+            await message.answer("Введите ID через запятую, например: 1, 2, 3")
+            return
+        await state.update_data(target_ids=list(dict.fromkeys(int(i) for i in ids)))
+    elif not text.isdigit():
         await message.answer("Введите число.")
         return
+    else:
+        await state.update_data(target_id=int(text))
 
-    await state.update_data(target_id=int(text))
     await message.answer("Введите дедлайн (YYYY-MM-DD HH:MM) или 'skip':", reply_markup=BACK_KB)
     await state.set_state(AssignHomework.waiting_for_deadline)
 
 
+async def announce_assignment(db, teacher, hw, deadline, submissions):
+    """Сообщить ученикам о новом ДЗ, не задерживая ответ учителю"""
+    telegram_ids = dict((await db.execute(
+        select(Student.id, Student.telegram_id)
+        .filter(Student.id.in_([student_id for _, student_id in submissions]), Student.telegram_id.is_not(None))
+    )).all())
+
+    messages = [
+        (telegram_ids[student_id],
+         f"📝 Новое ДЗ: «{hw.title}»\n"
+         f"📅 Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}\n"
+         f"💾 Отправьте файл с подписью {submission_id}")
+        for submission_id, student_id in submissions if student_id in telegram_ids
+    ]
+    title = f"Рассылка ДЗ «{hw.title}»"
+    if len(messages) < len(submissions):
+        title += f" (без Telegram: {len(submissions) - len(messages)})"
+    start_broadcast(bot, messages, teacher.telegram_id, title)
+
+
 @dp.message(AssignHomework.waiting_for_deadline)
-async def assign_deadline(message: types.Message, state: FSMContext):
+async def assign_deadline(message: types.Message, state: FSMContext, teacher: Teacher | None):
     text = message.text.strip()
     deadline = None
 
@@ -690,18 +989,19 @@ async def assign_deadline(message: types.Message, state: FSMContext):
         except:
             await message.answer("❌ Неверный формат. Используйте YYYY-MM-DD HH:MM")
             return
+        if deadline <= datetime.datetime.utcnow():
+            await message.answer("❌ Дедлайн уже прошёл. Введите дату в будущем:")
+            return
 
     data = await state.get_data()
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
-            await state.clear()
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        await state.clear()
+        return
 
-        hw = db.query(Homework).filter_by(id=data["hw_id"], teacher_id=teacher.id).first()
+    async with AsyncSessionLocal() as db:
+        hw = await db.scalar(select(Homework).filter_by(id=data["hw_id"], teacher_id=teacher.id))
         if not hw:
             await message.answer("❌ ДЗ не найдено.", reply_markup=MAIN_KB)
             await state.clear()
@@ -711,64 +1011,54 @@ async def assign_deadline(message: types.Message, state: FSMContext):
             deadline = datetime.datetime.utcnow() + datetime.timedelta(days=7)
 
         if data["target_type"] == "student":
-            student = db.query(Student).filter_by(id=data["target_id"], teacher_id=teacher.id).first()
+            student = await db.scalar(select(Student).filter_by(id=data["target_id"], teacher_id=teacher.id))
             if not student:
                 await message.answer("❌ Ученик не найден.", reply_markup=MAIN_KB)
                 await state.clear()
                 return
 
-            assignment = HomeworkAssignment(
-                homework_id=hw.id,
-                assigned_to_type="student",
-                assigned_to_id=student.id,
-                deadline=deadline
-            )
-            db.add(assignment)
-            db.commit()
-            db.refresh(assignment)
-
-            submission = HomeworkSubmission(
-                assignment_id=assignment.id,
-                student_id=student.id,
-                status="assigned"
-            )
-            db.add(submission)
-            db.commit()
+            _, submissions = await create_assignment(db, hw.id, "student", [student.id], deadline, target_id=student.id)
+            await db.commit()
+            await announce_assignment(db, teacher, hw, deadline, submissions)
 
             await message.answer(f"✅ ДЗ '{hw.title}' назначено {student.name}\n📅 Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}", reply_markup=MAIN_KB)
 
         elif data["target_type"] == "group":
-            group = db.query(Group).filter_by(id=data["target_id"], teacher_id=teacher.id).first()
+            group = await db.scalar(select(Group).filter_by(id=data["target_id"], teacher_id=teacher.id))
             if not group:
                 await message.answer("❌ Группа не найдена.", reply_markup=MAIN_KB)
                 await state.clear()
                 return
 
-            if not group.students:
+            student_ids = (await db.scalars(
+                select(GroupStudent.student_id).filter_by(group_id=group.id).order_by(GroupStudent.id)
+            )).all()
+            student_ids = list(dict.fromkeys(student_ids))
+            if not student_ids:
                 await message.answer("❌ В группе нет учеников.", reply_markup=MAIN_KB)
                 await state.clear()
                 return
 
-            assignment = HomeworkAssignment(
-                homework_id=hw.id,
-                assigned_to_type="group",
-                assigned_to_id=group.id,
-                deadline=deadline
-            )
-            db.add(assignment)
-            db.commit()
-            db.refresh(assignment)
-
-            for gs in group.students:
-                submission = HomeworkSubmission(
-                    assignment_id=assignment.id,
-                    student_id=gs.student_id,
-                    status="assigned"
-                )
-                db.add(submission)
+            _, submissions = await create_assignment(db, hw.id, "group", student_ids, deadline, target_id=group.id)
+            await db.commit()
+            await announce_assignment(db, teacher, hw, deadline, submissions)
+            await message.answer(f"✅ ДЗ '{hw.title}' назначено группе {group.title} ({len(student_ids)} учеников)\n📅 Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}", reply_markup=MAIN_KB)
+
+        elif data["target_type"] == "multi":
+            requested = data["target_ids"]
+            found = set((await db.scalars(
+                select(Student.id).filter(Student.id.in_(requested), Student.teacher_id == teacher.id)
+            )).all())
+            missing = [str(i) for i in requested if i not in found]
+            if missing:
+                await message.answer(f"❌ Ученики не найдены: {', '.join(missing)}", reply_markup=MAIN_KB)
+                await state.clear()
+                return
 
-            db.commit()
-            await message.answer(f"✅ ДЗ '{hw.title}' назначено группе {group.title} ({len(group.students)} учеников)\n📅 Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}", reply_markup=MAIN_KB)
+            _, submissions = await create_assignment(db, hw.id, "multi", requested, deadline)
+            await db.commit()
+            await announce_assignment(db, teacher, hw, deadline, submissions)
+            await message.answer(f"✅ ДЗ '{hw.title}' назначено {len(requested)} ученикам\n📅 Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}", reply_markup=MAIN_KB)
 
     await state.clear()
 
@@ -776,113 +1066,141 @@ async def assign_deadline(message: types.Message, state: FSMContext):
 # ======= Мои назначения =======
 @dp.message(F.text == "📚 Мои назначения")
 @dp.message(Command("my_assignments"))
-async def my_assignments(message: types.Message):
-    teacher_tg = str(message.from_user.id)
+@query_budget(1)
+async def my_assignments(message: types.Message, teacher: Teacher | None):
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        return
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
-            return
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_assignments_page(db, teacher)
 
-        assigns = (
-            db.query(HomeworkAssignment)
-            .join(Homework)
-            .filter(Homework.teacher_id == teacher.id)
-            .order_by(HomeworkAssignment.deadline)
-            .all()
-        )
+    if text is None:
+        await message.answer("Назначений нет.", reply_markup=MAIN_KB)
+        return
 
-        if not assigns:
-            await message.answer("Назначений нет.", reply_markup=MAIN_KB)
-            return
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or MAIN_KB)
+
+
+async def render_assignments_page(db, teacher, cursor=None, back=False):
+    page = await assignments_page(db, teacher.id, decode_dt_id_cursor(cursor) if cursor else None, back)
+    if not page.rows:
+        return None, None
 
-        text = "<b>📚 Ваши назначения:</b>\n\n"
-        for a in assigns:
-            target_info = ""
-            if a.assigned_to_type == "student":
-                student = db.query(Student).filter_by(id=a.assigned_to_id).first()
-                target_info = f"👤 {student.name}" if student else "👤 (удален)"
-            elif a.assigned_to_type == "group":
-                group = db.query(Group).filter_by(id=a.assigned_to_id).first()
-                target_info = f"👥 {group.title}" if group else "👥 (удалена)"
+    text = "<b>📚 Ваши назначения:</b>\n\n"
+    for a in page.rows:
+        target_info = ""
+        if a.assigned_to_type == "student":
+            target_info = f"👤 {a.student_name}" if a.student_name else "👤 (удален)"
+        elif a.assigned_to_type == "group":
+            target_info = f"👥 {a.group_title}" if a.group_title else "👥 (удалена)"
+        elif a.assigned_to_type == "multi":
+            target_info = f"👤👤 Учеников: {len(a.assigned_to_ids or [])}"
 
-            is_overdue = datetime.datetime.utcnow() > a.deadline
-            deadline_icon = "⚠️" if is_overdue else "📅"
+        is_overdue = datetime.datetime.utcnow() > a.deadline
+        deadline_icon = "⚠️" if is_overdue else "📅"
 
-            text += f"<b>{a.homework.title}</b>\n"
-            text += f"   {target_info}\n"
-            text += f"   {deadline_icon} {a.deadline.strftime('%d.%m.%Y %H:%M')}\n"
-            text += f"   ID: {a.id}\n\n"
+        text += f"<b>{a.title}</b>\n"
+        text += f"   {target_info}\n"
+        text += f"   {deadline_icon} {a.deadline.strftime('%d.%m.%Y %H:%M')}\n"
+        text += f"   ID: {a.id}\n\n"
 
-        text += "Просмотр статусов: /hw_status <ID_назначения>"
-        await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
+    text += "Просмотр статусов: /hw_status <ID_назначения>"
+    return text, page_keyboard("assign", page, lambda a: encode_cursor(a.deadline, a.id))
 
 
 @dp.message(Command("hw_status"))
-async def hw_status(message: types.Message):
+@query_budget(3)
+async def hw_status(message: types.Message, teacher: Teacher | None):
     args = message.text.split()
     if len(args) != 2 or not args[1].isdigit():
         await message.answer("Использование: /hw_status <ID_назначения>")
         return
 
     assign_id = int(args[1])
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-        assignment = db.query(HomeworkAssignment).filter_by(id=assign_id).first()
-        if not assignment:
+    async with AsyncSessionLocal() as db:
+        hw = (await db.execute(
+            select(Homework.title, Homework.teacher_id)
+            .join(HomeworkAssignment, HomeworkAssignment.homework_id == Homework.id)
+            .filter(HomeworkAssignment.id == assign_id)
+        )).first()
+        if not hw:
             await message.answer("❌ Назначение не найдено.")
             return
 
-        hw = assignment.homework
         if hw.teacher_id != teacher.id:
             await message.answer("❌ Это не ваше назначение.")
             return
 
-        submissions = assignment.submissions
-        if not submissions:
+        # Счётчики по статусам считает база, по индексу (assignment_id, status)
+        stats = {
+            row.status: row for row in (await db.execute(
+                select(
+                    HomeworkSubmission.status,
+                    func.count().label("count"),
+                    func.avg(HomeworkSubmission.score_percent).label("avg_percent"),
+                )
+                .filter(HomeworkSubmission.assignment_id == assign_id)
+                .group_by(HomeworkSubmission.status)
+            )).all()
+        }
+        if not stats:
             await message.answer("❌ Нет сданных работ.", reply_markup=MAIN_KB)
             return
 
-        text = f"<b>📊 Статус: {hw.title}</b>\n\n"
-
-        assigned = len(submissions)
-        submitted = len([s for s in submissions if s.status == "submitted"])
-        graded = len([s for s in submissions if s.status == "graded"])
-        assigned_only = assigned - submitted - graded
-
-        text += f"📈 Общая статистика:\n"
-        text += f"   📌 Назначено: {assigned}\n"
-        text += f"   ⏳ Ожидают проверки: {submitted}\n"
-        text += f"   ✅ Оценено: {graded}\n"
-        text += f"   📭 Не сдали: {assigned_only}\n\n"
-
-        text += "<b>Результаты:</b>\n"
-        for sub in submissions:
-            status_emoji = {
-                "assigned": "📭",
-                "submitted": "⏳",
-                "graded": "✅",
-                "overdue": "❌"
-            }.get(sub.status, "❓")
-
-            text += f"{status_emoji} <b>{sub.student.name}</b>"
-            if sub.status == "graded":
-                text += f" - {sub.score_value} баллов"
-            text += "\n"
-
-        await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
+        results = (await db.execute(
+            select(Student.name, HomeworkSubmission.status, HomeworkSubmission.score_value)
+            .join(Student, Student.id == HomeworkSubmission.student_id)
+            .filter(HomeworkSubmission.assignment_id == assign_id)
+            .order_by(Student.name, HomeworkSubmission.id)
+        )).all()
+
+    def count(status):
+        return stats[status].count if status in stats else 0
+
+    assigned = sum(row.count for row in stats.values())
+    submitted = count("submitted")
+    graded = count("graded")
+    overdue = count("overdue")
+    assigned_only = assigned - submitted - graded
+
+    text = f"<b>📊 Статус: {hw.title}</b>\n\n"
+    text += f"📈 Общая статистика:\n"
+    text += f"   📌 Назначено: {assigned}\n"
+    text += f"   ⏳ Ожидают проверки: {submitted}\n"
+    text += f"   ✅ Оценено: {graded}\n"
+    text += f"   📭 Не сдали: {assigned_only}\n"
+    if overdue:
+        text += f"   ❌ Из них просрочено: {overdue}\n"
+    if graded and stats["graded"].avg_percent is not None:
+        text += f"   📊 Средний результат: {round(stats['graded'].avg_percent)}%\n"
+    text += "\n"
+
+    text += "<b>Результаты:</b>\n"
+    for name, status, score_value in results:
+        status_emoji = {
+            "assigned": "📭",
+            "submitted": "⏳",
+            "graded": "✅",
+            "overdue": "❌"
+        }.get(status, "❓")
+
+        text += f"{status_emoji} <b>{name}</b>"
+        if status == "graded":
+            text += f" - {score_value} баллов"
+        text += "\n"
+
+    await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
 
 
 # ======= Загрузка файлов =======
 @dp.message(F.document)
-async def submit_file(message: types.Message):
+async def submit_file(message: types.Message, student: Student | None):
     caption = (message.caption or "").strip()
 
     if not caption or not caption.split()[0].isdigit():
@@ -890,50 +1208,62 @@ async def submit_file(message: types.Message):
         return
 
     submission_id = int(caption.split()[0])
-    student_tg = str(message.from_user.id)
-
-    with SessionLocal() as db:
-        student = db.query(Student).filter_by(telegram_id=student_tg).first()
-        if not student:
-            await message.answer("Сначала зарегистрируйтесь как ученик.", reply_markup=MAIN_KB)
-            return
 
-        submission = db.query(HomeworkSubmission).filter_by(id=submission_id, student_id=student.id).first()
-        if not submission:
-            await message.answer("❌ Сдача не найдена.", reply_markup=STUDENT_KB)
-            return
-
-        assignment = submission.assignment
-        if datetime.datetime.utcnow() > assignment.deadline:
-            await message.answer("❌ Дедлайн прошёл.", reply_markup=STUDENT_KB)
-            return
+    if not student:
+        await message.answer("Сначала зарегистрируйтесь как ученик.", reply_markup=MAIN_KB)
+        return
 
-        file = await message.document.get_file()
-        os.makedirs("data/submissions", exist_ok=True)
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(HomeworkAssignment.deadline, Homework.title, Teacher.telegram_id)
+            .select_from(HomeworkSubmission)
+            .join(HomeworkAssignment, HomeworkAssignment.id == HomeworkSubmission.assignment_id)
+            .join(Homework, Homework.id == HomeworkAssignment.homework_id)
+            .join(Teacher, Teacher.id == Homework.teacher_id)
+            .filter(HomeworkSubmission.id == submission_id, HomeworkSubmission.student_id == student.id)
+        )).first()
+
+    if not row:
+        await message.answer("❌ Сдача не найдена.", reply_markup=STUDENT_KB)
+        return
 
-        local_name = f"data/submissions/{submission.id}_{student.id}_{message.document.file_name}"
-        await file.download(destination=local_name)
+    deadline, hw_title, teacher_tg = row
+    if datetime.datetime.utcnow() > deadline:
+        await message.answer("❌ Дедлайн прошёл.", reply_markup=STUDENT_KB)
+        return
 
-        submission.file_path = local_name
-        submission.status = "submitted"
-        submission.submitted_at = datetime.datetime.utcnow()
-        db.commit()
+    # Файл качаем без открытой сессии: медленная загрузка не держит соединение пула
+    try:
+        file_path = await store_telegram_file(bot, message.document)
+    except SubmissionTooLarge:
+        await message.answer(f"❌ Файл слишком большой (максимум {MAX_SUBMISSION_SIZE // (1024 * 1024)} МБ).", reply_markup=STUDENT_KB)
+        return
 
-        hw = db.query(Homework).filter_by(id=assignment.homework_id).first()
-        teacher = db.query(Teacher).filter_by(id=hw.teacher_id).first()
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(HomeworkSubmission)
+            .filter_by(id=submission_id, student_id=student.id)
+            .values(
+                file_path=file_path,
+                file_name=message.document.file_name,
+                status="submitted",
+                submitted_at=datetime.datetime.utcnow(),
+            )
+        )
+        await db.commit()
 
-    await message.answer(f"✅ Файл загружен. ID сдачи: {submission.id}", reply_markup=STUDENT_KB)
+    await message.answer(f"✅ Файл загружен. ID сдачи: {submission_id}", reply_markup=STUDENT_KB)
 
-    if teacher and teacher.telegram_id:
-        await bot.send_message(
-            int(teacher.telegram_id),
-            f"📬 Новая работа от {student.name}\n📝 ДЗ: {hw.title}\n💾 /grade_submission {submission.id} <оценка> <комментарий>"
+    if teacher_tg:
+        await notify(
+            teacher_tg,
+            f"📬 Новая работа от {student.name}\n📝 ДЗ: {hw_title}\n💾 /grade_submission {submission_id} <оценка> <комментарий>"
         )
 
 
 # ======= Оценка =======
 @dp.message(Command("grade_submission"))
-async def grade(message: types.Message):
+async def grade(message: types.Message, teacher: Teacher | None):
     parts = message.text.strip().split(maxsplit=3)
 
     if len(parts) < 3:
@@ -952,15 +1282,20 @@ async def grade(message: types.Message):
         return
 
     comment = parts[3] if len(parts) > 3 else None
-    teacher_tg = str(message.from_user.id)
 
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        return
 
-        submission = db.query(HomeworkSubmission).filter_by(id=sub_id).first()
+    async with AsyncSessionLocal() as db:
+        submission = await db.scalar(
+            select(HomeworkSubmission)
+            .filter_by(id=sub_id)
+            .options(
+                selectinload(HomeworkSubmission.assignment).selectinload(HomeworkAssignment.homework),
+                selectinload(HomeworkSubmission.student),
+            )
+        )
         if not submission:
             await message.answer("❌ Сдача не найдена.", reply_markup=MAIN_KB)
             return
@@ -976,7 +1311,13 @@ async def grade(message: types.Message):
         submission.score_percent = int(score / hw.max_score * 100) if hw.max_score else None
         submission.teacher_comment = comment
         submission.status = "graded"
-        db.commit()
+        await db.commit()
+
+        parent_ids = (await db.scalars(
+            select(ParentStudent.parent_id).filter_by(student_id=submission.student_id)
+        )).all()
+        for parent_id in parent_ids:
+            parent_report_cache.pop(parent_id)
 
         student = submission.student
 
@@ -996,26 +1337,35 @@ class StudentFinance(StatesGroup):
     waiting_for_lessons = State()
 
 @dp.message(F.text.func(lambda t: t and "Финансы учеников" in t))
-async def student_finance_menu(message: types.Message):
+@query_budget(2)
+async def student_finance_menu(message: types.Message, teacher: Teacher | None):
     # Показываем список учеников с их балансом
-    tg_id = str(message.from_user.id)
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=tg_id).first()
-        if not teacher:
-            await message.answer("Сначала зарегистрируйтесь.")
-            return
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
 
-        students = teacher.students
-        if not students:
-            await message.answer("У вас пока нет учеников.", reply_markup=MAIN_KB)
-            return
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_finance_page(db, teacher)
+
+    if text is None:
+        await message.answer("У вас пока нет учеников.", reply_markup=MAIN_KB)
+        return
+
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or MAIN_KB)
 
-        text = "<b>💰 Баланс учеников:</b>\n\n"
-        for s in students:
-            text += f"👤 <b>{s.name}</b> (ID: {s.id}) — Баланс: {s.balance} зан.\n"
-        
-        text += "\nЧтобы внести оплату, используйте команду:\n/add_payment <ID_ученика>"
-        await message.answer(text, parse_mode="HTML", reply_markup=MAIN_KB)
+
+async def render_finance_page(db, teacher, cursor=None, back=False):
+    page = await balances_page(db, teacher.id, decode_id_cursor(cursor) if cursor else None, back)
+    if not page.rows:
+        return None, None
+
+    text = "<b>💰 Баланс учеников:</b>\n\n"
+    for s in page.rows:
+        text += f"👤 <b>{s.name}</b> (ID: {s.id}) — Баланс: {s.balance} зан.\n"
+    
+    text += "\nЧтобы внести оплату, используйте команду:\n/add_payment <ID_ученика>"
+    text += "\nИстория: /ledger <ID_ученика>\nКорректировка: /balance_fix <ID_ученика> <±занятия> [комментарий]"
+    return text, page_keyboard("finance", page, lambda s: encode_cursor(s.id))
 
 @dp.message(Command("add_payment"))
 async def add_payment_cmd(message: types.Message, state: FSMContext):
@@ -1040,48 +1390,168 @@ async def process_payment_amount(message: types.Message, state: FSMContext):
     await state.set_state(StudentFinance.waiting_for_lessons)
 
 @dp.message(StudentFinance.waiting_for_lessons)
-async def process_payment_lessons(message: types.Message, state: FSMContext):
+async def process_payment_lessons(message: types.Message, state: FSMContext, teacher: Teacher | None):
     if not message.text.isdigit():
         await message.answer("Введите число.")
         return
     
     lessons_count = int(message.text)
     data = await state.get_data()
+
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.", reply_markup=MAIN_KB)
+        await state.clear()
+        return
     
-    teacher_tg = str(message.from_user.id)
-    
-    with SessionLocal() as db:
-        teacher = db.query(Teacher).filter_by(telegram_id=teacher_tg).first()
-        student = db.query(Student).filter_by(id=data['student_id'], teacher_id=teacher.id).first()
+    async with AsyncSessionLocal() as db:
+        student = (await db.execute(
+            select(Student.id, Student.name).filter_by(id=data['student_id'], teacher_id=teacher.id)
+        )).first()
         
         if not student:
             await message.answer("Ученик не найден.", reply_markup=MAIN_KB)
             await state.clear()
             return
             
-        # Запись платежа
-        payment = StudentPayment(
-            teacher_id=teacher.id,
-            student_id=student.id,
-            amount=data['amount'],
-            lessons_added=lessons_count
+        # Запись платежа и движение по журналу — одной транзакцией
+        payment_id = await db.scalar(
+            insert(StudentPayment)
+            .values(
+                teacher_id=teacher.id,
+                student_id=student.id,
+                amount=data['amount'],
+                lessons_added=lessons_count
+            )
+            .returning(StudentPayment.id)
         )
-        # Обновление баланса
-        student.balance += lessons_count
-        
-        db.add(payment)
-        db.commit()
+        await add_entries(db, [
+            {"student_id": student.id, "kind": "payment", "delta": lessons_count, "payment_id": payment_id}
+        ])
+        await db.commit()
+
+        balance = await get_balance(db, student.id)
         
         await message.answer(
             f"✅ Оплата принята!\n"
             f"Ученик: {student.name}\n"
             f"Сумма: {data['amount']} руб.\n"
             f"Добавлено занятий: {lessons_count}\n"
-            f"Текущий баланс: {student.balance}",
+            f"Текущий баланс: {balance}",
             reply_markup=MAIN_KB
         )
     await state.clear()
 
+
+@dp.message(Command("balance_fix"))
+async def balance_fix(message: types.Message, teacher: Teacher | None):
+    parts = message.text.split(maxsplit=3)
+    if len(parts) < 3 or not parts[1].isdigit() or not parts[2].lstrip("+-").isdigit():
+        await message.answer("Использование: /balance_fix <ID_ученика> <±занятия> [комментарий]")
+        return
+
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
+
+    student_id, delta = int(parts[1]), int(parts[2])
+    comment = parts[3] if len(parts) > 3 else None
+
+    async with AsyncSessionLocal() as db:
+        student = await db.scalar(select(Student.id).filter_by(id=student_id, teacher_id=teacher.id))
+        if not student:
+            await message.answer("❌ Ученик не найден.")
+            return
+
+        await add_entries(db, [{"student_id": student_id, "kind": "correction", "delta": delta, "comment": comment}])
+        await db.commit()
+        balance = await get_balance(db, student_id)
+
+    await message.answer(f"✏️ Баланс исправлен на {delta:+d}. Текущий баланс: {balance}")
+
+
+@dp.message(Command("ledger"))
+@query_budget(3)
+async def ledger_history(message: types.Message, teacher: Teacher | None):
+    args = message.text.split()
+    if len(args) != 2 or not args[1].isdigit():
+        await message.answer("Использование: /ledger <ID_ученика>")
+        return
+
+    if not teacher:
+        await message.answer("Сначала зарегистрируйтесь.")
+        return
+
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_ledger_page(db, teacher, student_id=int(args[1]))
+
+    if text is None:
+        await message.answer("❌ Ученик не найден.", reply_markup=MAIN_KB)
+        return
+
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or MAIN_KB)
+
+
+async def render_ledger_page(db, teacher, cursor=None, back=False, student_id=None):
+    # Курсор: <ID_ученика>_<created_at>_<id>, новые записи сверху
+    key = None
+    if cursor:
+        student_id, cursor = cursor.split("_", 1)
+        student_id, key = int(student_id), decode_dt_id_cursor(cursor)
+
+    name = await db.scalar(select(Student.name).filter_by(id=student_id, teacher_id=teacher.id))
+    if name is None:
+        return None, None
+
+    page = await fetch_page(
+        db,
+        select(LedgerEntry.id, LedgerEntry.created_at, LedgerEntry.kind, LedgerEntry.delta, LedgerEntry.comment)
+        .filter(LedgerEntry.student_id == student_id),
+        (LedgerEntry.created_at, LedgerEntry.id),
+        key,
+        back,
+        desc=True,
+    )
+
+    text = f"<b>📒 Баланс {name}: {await get_balance(db, student_id)} зан.</b>\n\n"
+    if not page.rows:
+        return text + "Движений пока нет.", None
+
+    for e in page.rows:
+        text += f"{e.created_at.strftime('%d.%m.%Y %H:%M')} <b>{e.delta:+d}</b> {LEDGER_KINDS.get(e.kind, e.kind)}"
+        if e.comment:
+            text += f" — {e.comment}"
+        text += "\n"
+    return text, page_keyboard("ledger", page, lambda e: encode_cursor(student_id, e.created_at, e.id))
+
+
+# ======= Листание списков ⬅️/➡️ =======
+PAGED_VIEWS = {
+    "assign": render_assignments_page,
+    "library": render_library_page,
+    "groups": render_groups_page,
+    "finance": render_finance_page,
+    "ledger": render_ledger_page,
+}
+
+
+@dp.callback_query(PageCallback.filter(F.view.in_(PAGED_VIEWS)))
+async def paginate(callback: types.CallbackQuery, callback_data: PageCallback, teacher: Teacher | None):
+    render = PAGED_VIEWS.get(callback_data.view)
+    if not teacher or not render:
+        await callback.answer()
+        return
+
+    async with AsyncSessionLocal() as db:
+        text, kb = await render(db, teacher, callback_data.cursor, callback_data.back)
+
+    if text is None:
+        await callback.answer("Список пуст.")
+        return
+
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    await callback.answer()
+
+
 # ======= Кабинет Родителя (НОВОЕ) =======
 PARENT_KB = ReplyKeyboardMarkup(
     keyboard=[
@@ -1092,68 +1562,85 @@ PARENT_KB = ReplyKeyboardMarkup(
 )
 
 @dp.message(F.text == "👶 Мои дети")
-async def parent_children_list(message: types.Message):
-    tg_id = str(message.from_user.id)
-    with SessionLocal() as db:
-        parent = db.query(Parent).filter_by(telegram_id=tg_id).first()
-        if not parent:
-            await message.answer("Вы не зарегистрированы как родитель. Нажмите /register_parent")
-            return
-            
-        links = db.query(ParentStudent).filter_by(parent_id=parent.id).all()
-        if not links:
-            await message.answer("У вас нет привязанных детей. Используйте /link_child <ID>")
-            return
-            
-        text = "<b>Ваши дети:</b>\n\n"
-        for link in links:
-            s = link.student
-            teacher = db.query(Teacher).filter_by(id=s.teacher_id).first()
-            text += f"👶 <b>{s.name}</b> (ID: {s.id})\n"
-            text += f"   👨‍🏫 Преподаватель: {teacher.name if teacher else 'Неизвестно'}\n"
-            text += f"   💰 Баланс занятий: {s.balance}\n\n"
-            
-        await message.answer(text, parse_mode="HTML", reply_markup=PARENT_KB)
+@query_budget(2)
+async def parent_children_list(message: types.Message, parent: Parent | None):
+    if not parent:
+        await message.answer("Вы не зарегистрированы как родитель. Нажмите /register_parent")
+        return
+
+    async with AsyncSessionLocal() as db:
+        rows = await children(db, parent.id)
+
+    if not rows:
+        await message.answer("У вас нет привязанных детей. Используйте /link_child <ID>")
+        return
+
+    text = "<b>Ваши дети:</b>\n\n"
+    for s in rows:
+        text += f"👶 <b>{s.name}</b> (ID: {s.id})\n"
+        text += f"   👨‍🏫 Преподаватель: {s.teacher_name or 'Неизвестно'}\n"
+        text += f"   💰 Баланс занятий: {s.balance}\n\n"
+
+    await message.answer(text, parse_mode="HTML", reply_markup=PARENT_KB)
 
 @dp.message(F.text == "📊 Отчет успеваемости")
-async def parent_report(message: types.Message):
-    tg_id = str(message.from_user.id)
-    with SessionLocal() as db:
-        parent = db.query(Parent).filter_by(telegram_id=tg_id).first()
-        if not parent:
-            await message.answer("Сначала /register_parent")
-            return
+@query_budget(2)
+async def parent_report(message: types.Message, parent: Parent | None):
+    if not parent:
+        await message.answer("Сначала /register_parent")
+        return
 
-        links = db.query(ParentStudent).filter_by(parent_id=parent.id).all()
-        if not links:
-            await message.answer("Нет привязанных детей.")
-            return
+    report = parent_report_cache.get(parent.id)
+    if report is None:
+        async with AsyncSessionLocal() as db:
+            children = (await db.execute(
+                select(Student.id, Student.name)
+                .join(ParentStudent, ParentStudent.student_id == Student.id)
+                .filter(ParentStudent.parent_id == parent.id)
+                .order_by(ParentStudent.id)
+            )).all()
+            if not children:
+                await message.answer("Нет привязанных детей.")
+                return
 
-        report = "<b>📊 Отчет по успеваемости:</b>\n\n"
-        
-        for link in links:
-            s = link.student
-            # Берем последние 5 сданных работ
-            submissions = (
-                db.query(HomeworkSubmission)
-                .filter_by(student_id=s.id, status='graded')
-                .order_by(HomeworkSubmission.submitted_at.desc())
-                .limit(5)
-                .all()
+            # Последние PARENT_REPORT_LAST оценок каждого ребёнка — одним запросом
+            ranked = (
+                select(
+                    HomeworkSubmission.student_id,
+                    HomeworkSubmission.score_value,
+                    Homework.title,
+                    Homework.max_score,
+                    func.row_number().over(
+                        partition_by=HomeworkSubmission.student_id,
+                        order_by=(HomeworkSubmission.submitted_at.desc(), HomeworkSubmission.id.desc()),
+                    ).label("rn"),
+                )
+                .join(HomeworkAssignment, HomeworkAssignment.id == HomeworkSubmission.assignment_id)
+                .join(Homework, Homework.id == HomeworkAssignment.homework_id)
+                .join(ParentStudent, ParentStudent.student_id == HomeworkSubmission.student_id)
+                .filter(ParentStudent.parent_id == parent.id, HomeworkSubmission.status == "graded")
+                .subquery()
             )
-            
-            report += f"👶 <b>{s.name}</b>:\n"
-            if not submissions:
+            rows = (await db.execute(
+                select(ranked).filter(ranked.c.rn <= PARENT_REPORT_LAST).order_by(ranked.c.student_id, ranked.c.rn)
+            )).all()
+
+        by_student = {}
+        for row in rows:
+            by_student.setdefault(row.student_id, []).append(row)
+
+        report = "<b>📊 Отчет по успеваемости:</b>\n\n"
+        for student_id, name in children:
+            report += f"👶 <b>{name}</b>:\n"
+            if student_id not in by_student:
                 report += "   Нет оцененных работ.\n"
             else:
-                for sub in submissions:
-                    hw_title = sub.assignment.homework.title
-                    score = sub.score_value
-                    max_score = sub.assignment.homework.max_score
-                    report += f"   📝 {hw_title}: {score}/{max_score}\n"
+                for row in by_student[student_id]:
+                    report += f"   📝 {row.title}: {row.score_value}/{row.max_score}\n"
             report += "\n"
+        parent_report_cache.set(parent.id, report)
 
-        await message.answer(report, parse_mode="HTML", reply_markup=PARENT_KB)
+    await message.answer(report, parse_mode="HTML", reply_markup=PARENT_KB)
 
 
 
@@ -1168,73 +1655,225 @@ STUDENT_KB = ReplyKeyboardMarkup(
 
 
 @dp.message(Command("student_menu"))
-async def student_menu(message: types.Message):
-    tg_id = str(message.from_user.id)
-
-    with SessionLocal() as db:
-        student = db.query(Student).filter_by(telegram_id=tg_id).first()
-        if not student:
-            await message.answer("Вы не зарегистрированы как ученик.")
-            return
+async def student_menu(message: types.Message, student: Student | None):
+    if not student:
+        await message.answer("Вы не зарегистрированы как ученик.")
+        return
 
     await message.answer(f"👋 Привет, {student.name}!", reply_markup=STUDENT_KB)
 
 
+# Сколько последних оценённых работ показывать под активными
+STUDENT_GRADED_LAST = int(os.getenv("STUDENT_GRADED_LAST", "5"))
+
+
 @dp.message(F.text == "📝 Мои ДЗ")
-async def student_homeworks(message: types.Message):
-    tg_id = str(message.from_user.id)
+@query_budget(2)
+async def student_homeworks(message: types.Message, student: Student | None):
+    if not student:
+        await message.answer("Сначала зарегистрируйтесь как ученик.")
+        return
 
-    with SessionLocal() as db:
-        student = db.query(Student).filter_by(telegram_id=tg_id).first()
-        if not student:
-            await message.answer("Сначала зарегистрируйтесь как ученик.")
-            return
+    async with AsyncSessionLocal() as db:
+        text, kb = await render_student_homeworks_page(db, student)
 
-        submissions = (
-            db.query(HomeworkSubmission)
-            .filter_by(student_id=student.id)
-            .join(HomeworkAssignment)
-            .order_by(HomeworkAssignment.deadline)
-            .all()
+    if text is None:
+        await message.answer("У вас нет домашних заданий.", reply_markup=STUDENT_KB)
+        return
+
+    await message.answer(text, parse_mode="HTML", reply_markup=kb or STUDENT_KB)
+
+
+async def render_student_homeworks_page(db, student, cursor=None, back=False):
+    # Активные листаются по (дедлайн, id); история оценок целиком не грузится
+    page = await fetch_page(
+        db,
+        select(HomeworkSubmission)
+        .join(HomeworkSubmission.assignment)
+        .options(contains_eager(HomeworkSubmission.assignment).joinedload(HomeworkAssignment.homework))
+        .filter(
+            HomeworkSubmission.student_id == student.id,
+            HomeworkSubmission.status.in_(("assigned", "submitted", "overdue")),
+        ),
+        (HomeworkAssignment.deadline, HomeworkSubmission.id),
+        decode_dt_id_cursor(cursor) if cursor else None,
+        back,
+    )
+    active = [row[0] for row in page.rows]
+
+    graded = []
+    if not page.has_prev:
+        graded = (await db.scalars(
+            select(HomeworkSubmission)
+            .options(joinedload(HomeworkSubmission.assignment).joinedload(HomeworkAssignment.homework))
+            .filter_by(student_id=student.id, status="graded")
+            .order_by(HomeworkSubmission.submitted_at.desc(), HomeworkSubmission.id.desc())
+            .limit(STUDENT_GRADED_LAST)
+        )).all()
+
+    if not active and not graded:
+        return None, None
+
+    text = "<b>📝 Ваши домашние задания:</b>\n\n"
+
+    if active:
+        text += "<b>⏳ Активные:</b>\n"
+        for sub in active:
+            assignment = sub.assignment
+            hw = assignment.homework
+            # overdue проставляет планировщик дедлайнов
+            status_icon = "🔴" if sub.status == "overdue" else "🟡"
+
+            text += f"{status_icon} <b>{hw.title}</b>\n"
+            text += f"   📅 Дедлайн: {assignment.deadline.strftime('%d.%m.%Y %H:%M')}\n"
+            text += f"   Статус: {sub.status}\n"
+            text += f"   ID сдачи: {sub.id}\n\n"
+
+    if graded:
+        text += "<b>✅ Оцененные:</b>\n"
+        for sub in graded:
+            hw = sub.assignment.homework
+            text += f"<b>{hw.title}</b> - {sub.score_value} баллов\n"
+            if sub.teacher_comment:
+                text += f"   Комментарий: {sub.teacher_comment}\n"
+            text += "\n"
+
+    text += "\n💾 Загрузите файл с текстом '/hw <ID_сдачи>' в подписи"
+    kb = None
+    if active:
+        kb = page_keyboard("hw", page, lambda row: encode_cursor(row[0].assignment.deadline, row[0].id))
+    return text, kb
+
+
+STUDENT_PAGED_VIEWS = {
+    "hw": render_student_homeworks_page,
+}
+
+
+@dp.callback_query(PageCallback.filter(F.view.in_(STUDENT_PAGED_VIEWS)))
+async def paginate_student(callback: types.CallbackQuery, callback_data: PageCallback, student: Student | None):
+    if not student:
+        await callback.answer()
+        return
+
+    async with AsyncSessionLocal() as db:
+        text, kb = await STUDENT_PAGED_VIEWS[callback_data.view](db, student, callback_data.cursor, callback_data.back)
+
+    if text is None:
+        await callback.answer("Список пуст.")
+        return
+
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    await callback.answer()
+
+
+SCHEDULE_DAYS = int(os.getenv("SCHEDULE_DAYS", "14"))
+SCHEDULE_LIMIT = 30
+
+
+@dp.message(F.text == "📅 Расписание")
+@query_budget(1)
+async def student_schedule(message: types.Message, student: Student | None):
+    if not student:
+        await message.answer("Сначала зарегистрируйтесь как ученик.")
+        return
+
+    now = datetime.datetime.utcnow()
+    until = now + datetime.timedelta(days=SCHEDULE_DAYS)
+
+    # Личные и групповые уроки — две выборки по индексам (student_id|group_id, start_time)
+    personal = select(Lesson.start_time, Lesson.topic, null().label("group_title")).filter(
+        Lesson.student_id == student.id, Lesson.start_time >= now, Lesson.start_time < until
+    )
+    in_groups = (
+        select(Lesson.start_time, Lesson.topic, Group.title.label("group_title"))
+        .join(Group, Group.id == Lesson.group_id)
+        .filter(
+            Lesson.group_id.in_(select(GroupStudent.group_id).filter(GroupStudent.student_id == student.id)),
+            Lesson.start_time >= now,
+            Lesson.start_time < until,
         )
+    )
+    lessons = union_all(personal, in_groups).subquery()
 
-        if not submissions:
-            await message.answer("У вас нет домашних заданий.", reply_markup=STUDENT_KB)
-            return
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(lessons).order_by(lessons.c.start_time).limit(SCHEDULE_LIMIT)
+        )).all()
 
-        text = "<b>📝 Ваши домашние задания:</b>\n\n"
+    if not rows:
+        await message.answer(f"📅 На ближайшие {SCHEDULE_DAYS} дней уроков нет.", reply_markup=STUDENT_KB)
+        return
 
-        active = [s for s in submissions if s.status in ("assigned", "submitted")]
-        graded = [s for s in submissions if s.status == "graded"]
+    text = f"<b>📅 Расписание на {SCHEDULE_DAYS} дней:</b>\n\n"
+    for row in rows:
+        text += f"🕒 {row.start_time.strftime('%d.%m.%Y %H:%M')} — {row.topic}"
+        if row.group_title:
+            text += f" (👥 {row.group_title})"
+        text += "\n"
 
-        if active:
-            text += "<b>⏳ Активные:</b>\n"
-            for sub in active:
-                assignment = sub.assignment
-                hw = assignment.homework
-                is_overdue = datetime.datetime.utcnow() > assignment.deadline
-                status_icon = "🔴" if is_overdue else "🟡"
+    await message.answer(text, parse_mode="HTML", reply_markup=STUDENT_KB)
 
-                text += f"{status_icon} <b>{hw.title}</b>\n"
-                text += f"   📅 Дедлайн: {assignment.deadline.strftime('%d.%m.%Y %H:%M')}\n"
-                text += f"   Статус: {sub.status}\n"
-                text += f"   ID сдачи: {sub.id}\n\n"
 
-        if graded:
-            text += "<b>✅ Оцененные:</b>\n"
-            for sub in graded:
-                hw = sub.assignment.homework
-                text += f"<b>{hw.title}</b> - {sub.score_value} баллов\n"
-                if sub.teacher_comment:
-                    text += f"   Комментарий: {sub.teacher_comment}\n"
-                text += "\n"
+@dp.message(F.text == "📊 Прогресс")
+@query_budget(1)
+async def student_progress(message: types.Message, student: Student | None):
+    if not student:
+        await message.answer("Сначала зарегистрируйтесь как ученик.")
+        return
 
-        text += "\n💾 Загрузите файл с текстом '/hw <ID_сдачи>' в подписи"
-        await message.answer(text, parse_mode="HTML", reply_markup=STUDENT_KB)
+    # Одним агрегатом: счётчики по статусам, средний результат
+    # и тренд — последние 5 оценок против 5 предыдущих
+    ranked = (
+        select(
+            HomeworkSubmission.status,
+            HomeworkSubmission.score_percent,
+            func.row_number().over(
+                partition_by=HomeworkSubmission.status,
+                order_by=(HomeworkSubmission.submitted_at.desc(), HomeworkSubmission.id.desc()),
+            ).label("rn"),
+        )
+        .filter(HomeworkSubmission.student_id == student.id)
+        .subquery()
+    )
+    graded = ranked.c.status == "graded"
+
+    async with AsyncSessionLocal() as db:
+        stats = (await db.execute(select(
+            func.count().label("total"),
+            func.count(case((graded, 1))).label("graded"),
+            func.count(case((ranked.c.status == "overdue", 1))).label("overdue"),
+            func.avg(case((graded, ranked.c.score_percent))).label("avg_all"),
+            func.avg(case((and_(graded, ranked.c.rn <= 5), ranked.c.score_percent))).label("avg_recent"),
+            func.avg(case((and_(graded, ranked.c.rn > 5, ranked.c.rn <= 10), ranked.c.score_percent))).label("avg_prev"),
+        ))).one()
+
+    if not stats.total:
+        await message.answer("Пока нет домашних заданий.", reply_markup=STUDENT_KB)
+        return
+
+    text = "<b>📊 Ваш прогресс:</b>\n\n"
+    text += f"📝 Всего заданий: {stats.total}\n"
+    text += f"✅ Оценено: {stats.graded}\n"
+    if stats.overdue:
+        text += f"❌ Просрочено: {stats.overdue}\n"
+    if stats.avg_all is not None:
+        text += f"📈 Средний результат: {round(stats.avg_all)}%\n"
+    if stats.avg_recent is not None:
+        text += f"🆕 Последние 5 работ: {round(stats.avg_recent)}%"
+        if stats.avg_prev is not None:
+            diff = round(stats.avg_recent - stats.avg_prev)
+            text += f" ({'📈 +' if diff >= 0 else '📉 '}{diff}% к предыдущим)"
+        text += "\n"
+
+    await message.answer(text, parse_mode="HTML", reply_markup=STUDENT_KB)
 
 
 async def main():
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await dp.storage.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
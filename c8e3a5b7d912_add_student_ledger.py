@@ -0,0 +1,65 @@
+"""add student ledger
+
+Revision ID: c8e3a5b7d912
+Revises: 7a4c2e9f5b16
+Create Date: 2026-10-18 16:30:05.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e3a5b7d912'
+down_revision: Union[str, Sequence[str], None] = '7a4c2e9f5b16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('student_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('lesson_id', sa.Integer(), nullable=True),
+    sa.Column('comment', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ),
+    sa.ForeignKeyConstraint(['payment_id'], ['student_payments.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_student_ledger_student_id_created_at', 'student_ledger', ['student_id', 'created_at'], unique=False)
+    op.create_index('ix_student_ledger_created_at', 'student_ledger', ['created_at'], unique=False)
+    op.create_table('balance_snapshots',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('student_id')
+    )
+
+    # Текущие балансы переносим в журнал начальным остатком
+    op.execute(
+        "INSERT INTO student_ledger (student_id, kind, delta, comment, created_at) "
+        "SELECT id, 'opening', balance, 'Перенос баланса', CURRENT_TIMESTAMP FROM students "
+        "WHERE balance IS NOT NULL AND balance <> 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Возвращаем в students.balance итог по журналу
+    op.execute(
+        "UPDATE students SET balance = COALESCE("
+        "(SELECT SUM(delta) FROM student_ledger WHERE student_ledger.student_id = students.id), 0)"
+    )
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_student_ledger_created_at', table_name='student_ledger')
+    op.drop_index('ix_student_ledger_student_id_created_at', table_name='student_ledger')
+    op.drop_table('student_ledger')
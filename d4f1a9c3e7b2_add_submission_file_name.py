@@ -0,0 +1,29 @@
+"""add submission file name
+
+Revision ID: d4f1a9c3e7b2
+Revises: c8e3a5b7d912
+Create Date: 2026-10-18 18:05:12.447210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f1a9c3e7b2'
+down_revision: Union[str, Sequence[str], None] = 'c8e3a5b7d912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Старые сдачи лежат по путям с расширением и остаются как есть; имя для них неизвестно
+    op.add_column('homework_submissions', sa.Column('file_name', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('homework_submissions', 'file_name')
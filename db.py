@@ -1,9 +1,32 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from .metrics import instrument_engine
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+
+def make_async_url(url):
+    """postgresql://... -> postgresql+asyncpg://... (то же для sqlite)"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_async_url(DATABASE_URL)
+
 engine = create_engine(DATABASE_URL, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+# Асинхронный доступ для бота: запросы не блокируют event loop aiogram
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Время и число запросов для /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine, "async")
+
 Base = declarative_base()
@@ -0,0 +1,32 @@
+"""balance snapshot last entry id
+
+Revision ID: e7a2c4f8b135
+Revises: d4f1a9c3e7b2
+Create Date: 2026-10-18 18:40:37.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2c4f8b135'
+down_revision: Union[str, Sequence[str], None] = 'd4f1a9c3e7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Снимки — производные данные: планировщик пересоберёт их по id движений
+    op.execute("DELETE FROM balance_snapshots")
+    op.add_column('balance_snapshots', sa.Column('last_entry_id', sa.Integer(), server_default='0', nullable=False))
+    op.alter_column('balance_snapshots', 'last_entry_id', server_default=None)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM balance_snapshots")
+    op.drop_column('balance_snapshots', 'last_entry_id')
@@ -0,0 +1,33 @@
+"""ledger student id id index
+
+Revision ID: f3b8d1e6a4c9
+Revises: e7a2c4f8b135
+Create Date: 2026-10-18 19:20:44.613508
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d1e6a4c9'
+down_revision: Union[str, Sequence[str], None] = 'e7a2c4f8b135'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Баланс читает движения после снимка по id — диапазоном по (student_id, id)
+    op.create_index('ix_student_ledger_student_id_id', 'student_ledger', ['student_id', 'id'], unique=False)
+    # Снимки ищут границу по первичному ключу, отдельный индекс по created_at больше не нужен;
+    # (student_id, created_at) остаётся для истории /ledger
+    op.drop_index('ix_student_ledger_created_at', table_name='student_ledger')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_student_ledger_created_at', 'student_ledger', ['created_at'], unique=False)
+    op.drop_index('ix_student_ledger_student_id_id', table_name='student_ledger')
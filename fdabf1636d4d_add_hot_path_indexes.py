@@ -0,0 +1,52 @@
+"""add hot path indexes
+
+Revision ID: fdabf1636d4d
+Revises: 0f3421f8b53a
+Create Date: 2026-10-18 10:12:40.118304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fdabf1636d4d'
+down_revision: Union[str, Sequence[str], None] = '0f3421f8b53a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_students_teacher_id'), 'students', ['teacher_id'], unique=False)
+    op.create_index(op.f('ix_groups_teacher_id'), 'groups', ['teacher_id'], unique=False)
+    op.create_index('ix_homeworks_teacher_id_saved_in_library', 'homeworks', ['teacher_id', 'saved_in_library'], unique=False)
+    op.create_index('ix_homework_assignments_homework_id_deadline', 'homework_assignments', ['homework_id', 'deadline'], unique=False)
+    op.create_index('ix_homework_submissions_student_id_status_submitted_at', 'homework_submissions', ['student_id', 'status', 'submitted_at'], unique=False)
+    op.create_index('ix_homework_submissions_assignment_id_status', 'homework_submissions', ['assignment_id', 'status'], unique=False)
+
+    # Перед уникальными ограничениями убираем дубли, оставшиеся от check-then-insert
+    op.execute(
+        "DELETE FROM group_students WHERE id NOT IN "
+        "(SELECT MIN(id) FROM group_students GROUP BY group_id, student_id)"
+    )
+    op.execute(
+        "DELETE FROM parent_students WHERE id NOT IN "
+        "(SELECT MIN(id) FROM parent_students GROUP BY parent_id, student_id)"
+    )
+    op.create_unique_constraint('uq_group_students_group_id_student_id', 'group_students', ['group_id', 'student_id'])
+    op.create_unique_constraint('uq_parent_students_parent_id_student_id', 'parent_students', ['parent_id', 'student_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_parent_students_parent_id_student_id', 'parent_students', type_='unique')
+    op.drop_constraint('uq_group_students_group_id_student_id', 'group_students', type_='unique')
+    op.drop_index('ix_homework_submissions_assignment_id_status', table_name='homework_submissions')
+    op.drop_index('ix_homework_submissions_student_id_status_submitted_at', table_name='homework_submissions')
+    op.drop_index('ix_homework_assignments_homework_id_deadline', table_name='homework_assignments')
+    op.drop_index('ix_homeworks_teacher_id_saved_in_library', table_name='homeworks')
+    op.drop_index(op.f('ix_groups_teacher_id'), table_name='groups')
+    op.drop_index(op.f('ix_students_teacher_id'), table_name='students')
@@ -0,0 +1,27 @@
+import os
+from aiogram.fsm.storage.memory import MemoryStorage
+
+# memory    — состояние в памяти процесса (dev, один воркер)
+# redis     — общий Redis, диалоги переживают рестарт и видны всем репликам
+# fakeredis — RedisStorage поверх fakeredis, для локальных прогонов без Redis (requirements-dev.txt)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "redis" if os.getenv("REDIS_URL") else "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Брошенные на полпути диалоги не копятся в Redis вечно
+FSM_TTL = int(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+
+
+def make_fsm_storage():
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+
+    from aiogram.fsm.storage.redis import RedisStorage
+
+    if FSM_STORAGE == "redis":
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+
+    if FSM_STORAGE == "fakeredis":
+        from fakeredis.aioredis import FakeRedis
+        return RedisStorage(FakeRedis(), state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+
+    raise RuntimeError(f"Unknown FSM_STORAGE: {FSM_STORAGE}")
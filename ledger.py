@@ -0,0 +1,141 @@
+"""
+Баланс занятий ученика — журнал движений student_ledger (оплаты, списания
+за уроки, корректировки). Записи только добавляются.
+
+Баланс = снимок из balance_snapshots + сумма движений с id больше
+снимкового last_entry_id. Снимки двигает планировщик; они отстают от
+текущего момента на LEDGER_SNAPSHOT_LAG, чтобы не пропустить записи
+транзакций, которые вставили строку раньше, а закоммитили позже.
+"""
+import datetime
+import os
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import BalanceSnapshot, LedgerEntry, Student
+
+LEDGER_SNAPSHOT_LAG = int(os.getenv("LEDGER_SNAPSHOT_LAG", "3600"))  # секунд
+LEDGER_SNAPSHOT_BATCH = 500
+
+LEDGER_KINDS = {
+    "opening": "📂 Начальный остаток",
+    "payment": "💵 Оплата",
+    "lesson": "📅 Урок",
+    "correction": "✏️ Корректировка",
+}
+
+# Движения с id до этого уже разнесены по снимкам в этом процессе
+_snapshot_watermark = 0
+
+
+async def add_entries(db, entries):
+    """Вставка движений одним INSERT; коммит — на вызывающей стороне"""
+    if entries:
+        await db.execute(insert(LedgerEntry), entries)
+
+
+def _balances_select(student_ids):
+    # Движения после снимка — диапазон по индексу (student_id, id), а не весь журнал ученика
+    return (
+        select(
+            Student.id,
+            func.coalesce(BalanceSnapshot.balance, 0) + func.coalesce(func.sum(LedgerEntry.delta), 0),
+        )
+        .select_from(Student)
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.student_id == Student.id)
+        .outerjoin(LedgerEntry, and_(
+            LedgerEntry.student_id == Student.id,
+            LedgerEntry.id > func.coalesce(BalanceSnapshot.last_entry_id, 0),
+        ))
+        .filter(Student.id.in_(student_ids))
+        .group_by(Student.id, BalanceSnapshot.balance)
+    )
+
+
+async def get_balances(db, student_ids):
+    """{student_id: баланс} одним запросом: снимок + движения после него"""
+    if not student_ids:
+        return {}
+
+    rows = await db.execute(_balances_select(student_ids))
+    return dict(rows.all())
+
+
+async def get_balance(db, student_id):
+    return (await get_balances(db, [student_id])).get(student_id, 0)
+
+
+def _upsert_snapshots(db):
+    """
+    INSERT ... ON CONFLICT для текущего диалекта. Снимок, который успела
+    обновить другая реплика, перезаписывается, только если новый дальше
+    по журналу: пара (balance, last_entry_id) согласована в обоих случаях.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(BalanceSnapshot)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(BalanceSnapshot)
+    else:
+        raise RuntimeError(f"Unsupported dialect: {dialect}")
+    return stmt.on_conflict_do_update(
+        index_elements=[BalanceSnapshot.student_id],
+        set_={
+            "balance": stmt.excluded.balance,
+            "last_entry_id": stmt.excluded.last_entry_id,
+            "as_of": stmt.excluded.as_of,
+        },
+        where=stmt.excluded.last_entry_id > BalanceSnapshot.last_entry_id,
+    )
+
+
+async def take_snapshots(db, now):
+    """
+    Переносит в снимки движения старше LEDGER_SNAPSHOT_LAG. Граница —
+    id последней такой записи: всё, что ниже, к этому моменту закоммичено.
+    Смотрит только id после прошлого прохода (по первичному ключу).
+    Возвращает число обновлённых снимков.
+    """
+    global _snapshot_watermark
+    as_of = now - datetime.timedelta(seconds=LEDGER_SNAPSHOT_LAG)
+    upto = await db.scalar(
+        select(func.max(LedgerEntry.id))
+        .filter(LedgerEntry.id > _snapshot_watermark, LedgerEntry.created_at <= as_of)
+    )
+    if upto is None:
+        return 0
+    total = 0
+
+    while True:
+        rows = (await db.execute(
+            select(
+                LedgerEntry.student_id,
+                func.sum(LedgerEntry.delta).label("delta"),
+                func.max(LedgerEntry.id).label("last_entry_id"),
+                BalanceSnapshot.balance,
+            )
+            .outerjoin(BalanceSnapshot, BalanceSnapshot.student_id == LedgerEntry.student_id)
+            .filter(
+                LedgerEntry.id > _snapshot_watermark,
+                LedgerEntry.id <= upto,
+                LedgerEntry.id > func.coalesce(BalanceSnapshot.last_entry_id, 0),
+            )
+            .group_by(LedgerEntry.student_id, BalanceSnapshot.balance)
+            .limit(LEDGER_SNAPSHOT_BATCH)
+        )).all()
+        if not rows:
+            break
+
+        await db.execute(_upsert_snapshots(db), [
+            {
+                "student_id": r.student_id,
+                "balance": (r.balance or 0) + r.delta,
+                "last_entry_id": r.last_entry_id,
+                "as_of": as_of,
+            }
+            for r in rows
+        ])
+        await db.commit()
+        total += len(rows)
+
+    _snapshot_watermark = upto
+    return total
@@ -0,0 +1,167 @@
+import datetime
+import os
+import uuid
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from .ledger import add_entries
+from .models import GroupStudent, Lesson, LessonDebit, Teacher
+
+LESSON_DURATION = int(os.getenv("LESSON_DURATION", "60"))  # минут по умолчанию
+# Верхняя граница длительности: по ней строится окно поиска пересечений
+LESSON_MAX_DURATION = 240
+LESSON_SERIES_MAX = int(os.getenv("LESSON_SERIES_MAX", "60"))
+LESSON_DEBIT_BATCH = int(os.getenv("LESSON_DEBIT_BATCH", "100"))
+
+
+def series_last_date(start, every_days):
+    """Самая поздняя дата окончания, при которой в серии не больше LESSON_SERIES_MAX уроков"""
+    return (start + datetime.timedelta(days=every_days * (LESSON_SERIES_MAX - 1))).date()
+
+
+def expand_occurrences(start, every_days=None, until=None):
+    """
+    Даты уроков серии: start, start + every_days, ... не позже until.
+    until позже series_last_date — ValueError: молча обрезать серию нельзя.
+    """
+    if not every_days:
+        return [start]
+    if until > series_last_date(start, every_days):
+        raise ValueError(f"Series longer than {LESSON_SERIES_MAX} lessons")
+
+    step = datetime.timedelta(days=every_days)
+    occurrences = []
+    current = start
+    while current.date() <= until:
+        occurrences.append(current)
+        current += step
+    return occurrences
+
+
+async def find_conflicts(db, teacher_id, occurrences, duration):
+    """
+    Уроки учителя, пересекающиеся с любым из occurrences.
+    Каждое окно — диапазон по индексу (teacher_id, start_time):
+    урок длиной не больше LESSON_MAX_DURATION, начавшийся раньше
+    occ - LESSON_MAX_DURATION, закончился до occ.
+    Блокирует строку учителя до конца транзакции, чтобы два параллельных
+    диалога не заняли одно время.
+    """
+    await db.execute(select(Teacher.id).filter_by(id=teacher_id).with_for_update())
+
+    lookback = datetime.timedelta(minutes=LESSON_MAX_DURATION)
+    length = datetime.timedelta(minutes=duration)
+    windows = [
+        and_(Lesson.start_time > occ - lookback, Lesson.start_time < occ + length)
+        for occ in occurrences
+    ]
+    candidates = (await db.execute(
+        select(Lesson.start_time, Lesson.duration_minutes, Lesson.topic)
+        .filter(Lesson.teacher_id == teacher_id, or_(*windows))
+        .order_by(Lesson.start_time)
+    )).all()
+
+    return [
+        lesson for lesson in candidates
+        if any(
+            lesson.start_time < occ + length
+            and occ < lesson.start_time + datetime.timedelta(minutes=lesson.duration_minutes)
+            for occ in occurrences
+        )
+    ]
+
+
+async def create_lessons(db, teacher_id, topic, occurrences, duration, student_id=None, group_id=None):
+    """
+    Вставляет все уроки серии одним INSERT (executemany).
+    Коммит — на вызывающей стороне. Возвращает число уроков.
+    """
+    series_id = uuid.uuid4().hex if len(occurrences) > 1 else None
+    await db.execute(
+        insert(Lesson),
+        [
+            {
+                "teacher_id": teacher_id,
+                "student_id": student_id,
+                "group_id": group_id,
+                "topic": topic,
+                "start_time": occ,
+                "duration_minutes": duration,
+                "series_id": series_id,
+            }
+            for occ in occurrences
+        ],
+    )
+    return len(occurrences)
+
+
+def _insert_ignore(db, model):
+    """INSERT ... ON CONFLICT DO NOTHING для текущего диалекта"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    raise RuntimeError(f"Unsupported dialect: {dialect}")
+
+
+async def debit_lesson(db, lesson, now):
+    """
+    Списывает по занятию с каждого ученика урока (групповой — всей группой за раз).
+    Повторный вызов ничего не списывает: строка lesson_debits на пару
+    (урок, ученик) вставляется ON CONFLICT DO NOTHING, баланс уменьшается
+    только тем, для кого она действительно вставилась (запись -1 в журнал).
+    Коммит — на вызывающей стороне. Возвращает id учеников, с кого списано.
+    """
+    if lesson.student_id is not None:
+        student_ids = [lesson.student_id]
+    elif lesson.group_id is not None:
+        student_ids = (await db.scalars(
+            select(GroupStudent.student_id).filter_by(group_id=lesson.group_id)
+        )).all()
+    else:
+        student_ids = []
+
+    debited = []
+    if student_ids:
+        debited = (await db.scalars(
+            _insert_ignore(db, LessonDebit).returning(LessonDebit.student_id),
+            [{"lesson_id": lesson.id, "student_id": student_id, "created_at": now} for student_id in student_ids],
+        )).all()
+
+    await add_entries(db, [
+        {"student_id": student_id, "kind": "lesson", "delta": -1, "lesson_id": lesson.id, "created_at": now}
+        for student_id in debited
+    ])
+
+    await db.execute(
+        update(Lesson)
+        .where(Lesson.id == lesson.id, Lesson.held_at.is_(None))
+        .values(held_at=now)
+    )
+    return debited
+
+
+async def debit_finished_lessons(db, now, limit=LESSON_DEBIT_BATCH):
+    """
+    Проход планировщика: закрывает закончившиеся и ещё не отмеченные уроки.
+    SKIP LOCKED — реплики и ручная отметка не мешают друг другу.
+    Возвращает число закрытых уроков.
+    """
+    lookback = datetime.timedelta(minutes=LESSON_MAX_DURATION)
+    started = (await db.execute(
+        select(Lesson.id, Lesson.student_id, Lesson.group_id, Lesson.start_time, Lesson.duration_minutes)
+        .filter(Lesson.held_at.is_(None), Lesson.start_time <= now)
+        .order_by(Lesson.start_time)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )).all()
+
+    finished = [
+        lesson for lesson in started
+        if lesson.start_time + datetime.timedelta(minutes=lesson.duration_minutes) <= now
+        or lesson.start_time <= now - lookback
+    ]
+    for lesson in finished:
+        await debit_lesson(db, lesson, now)
+    await db.commit()
+    return len(finished)
@@ -1,5 +1,7 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from .db import engine, Base
+from .metrics import render_metrics
 from . import models
 from .api import v1
 import os
@@ -10,3 +12,16 @@ app = FastAPI(title="Bit-Fotutors API")
 Base.metadata.create_all(bind=engine)
 
 app.include_router(v1.router, prefix="/api/v1")
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Вебхук Telegram в том же процессе, что и API (иначе бот работает через polling)
+if os.getenv("BOT_MODE") == "webhook":
+    from . import webhook
+    app.include_router(webhook.router)
+    app.on_event("startup")(webhook.on_startup)
+    app.on_event("shutdown")(webhook.on_shutdown)
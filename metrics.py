@@ -0,0 +1,187 @@
+"""
+Метрики в текстовом формате Prometheus: задержка хендлеров бота,
+ошибки, число и время SQL-запросов на апдейт, занятость пула.
+Отдаются на GET /metrics (main.py).
+
+Запросы привязываются к апдейту через contextvar: middleware кладёт туда
+UpdateStats, хуки before/after_cursor_execute дописывают в него.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from sqlalchemy import event
+from .sql_debug import SQL_DEBUG, log_slow_query
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class UpdateStats:
+    __slots__ = ("handler", "queries", "db_seconds", "budget", "budget_base", "statements")
+
+    def __init__(self):
+        self.handler = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.budget = None  # @query_budget хендлера
+        self.budget_base = 0  # запросов до хендлера (определение роли)
+        self.statements = [] if SQL_DEBUG else None  # тексты запросов для поиска N+1
+
+
+current_update = contextvars.ContextVar("current_update", default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    # Значения — имена хендлеров, состояний FSM и исключений, экранирование не нужно
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        # Копия под замком: inc из потоков пула не меняет словарь посреди обхода
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label_values -> [counts по бакетам, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(
+                (values, (list(counts), total, count)) for values, (counts, total, count) in self._series.items()
+            )
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels + ("le",), values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+handler_latency = Histogram(
+    "bot_handler_duration_seconds", "Время обработки апдейта", ("handler",)
+)
+handler_errors = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("handler", "error")
+)
+updates_by_state = Counter(
+    "bot_updates_total", "Апдейты по хендлеру и состоянию FSM", ("handler", "state")
+)
+update_queries = Histogram(
+    "bot_update_db_queries", "SQL-запросов за апдейт", ("handler",), buckets=QUERY_COUNT_BUCKETS
+)
+update_db_time = Histogram(
+    "bot_update_db_seconds", "Суммарное время SQL за апдейт", ("handler",)
+)
+query_latency = Histogram(
+    "db_query_duration_seconds", "Время одного SQL-запроса", ("engine",)
+)
+
+_engines = {}
+
+
+def instrument_engine(engine, name):
+    """Хуки на курсор: время каждого запроса + учёт в текущем апдейте"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    _engines[name] = sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        query_latency.observe(elapsed, name)
+        stats = current_update.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            if stats.statements is not None:
+                stats.statements.append(statement)
+        log_slow_query(stats, statement, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # Запрос упал — after_cursor_execute не будет, метку старта снимаем здесь
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+def observe_update(stats, state, elapsed, error=None):
+    handler = stats.handler or "unhandled"
+    handler_latency.observe(elapsed, handler)
+    updates_by_state.inc(handler, state or "none")
+    update_queries.observe(stats.queries, handler)
+    update_db_time.observe(stats.db_seconds, handler)
+    if error is not None:
+        handler_errors.inc(handler, type(error).__name__)
+
+
+def _pool_lines():
+    lines = [
+        "# HELP db_pool_checked_out Соединений пула в работе",
+        "# TYPE db_pool_checked_out gauge",
+    ]
+    sizes = [
+        "# HELP db_pool_size Размер пула",
+        "# TYPE db_pool_size gauge",
+    ]
+    for name, engine in sorted(_engines.items()):
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            lines.append(f'db_pool_checked_out{{engine="{name}"}} {pool.checkedout()}')
+        if hasattr(pool, "size"):
+            sizes.append(f'db_pool_size{{engine="{name}"}} {pool.size()}')
+    return lines + sizes
+
+
+def render_metrics():
+    lines = []
+    for metric in (handler_latency, handler_errors, updates_by_state, update_queries, update_db_time, query_latency):
+        lines.extend(metric.render())
+    lines.extend(_pool_lines())
+    return "\n".join(lines) + "\n"
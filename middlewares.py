@@ -0,0 +1,100 @@
+import os
+import time
+from aiogram import BaseMiddleware
+from sqlalchemy import literal, select
+from .cache import TTLCache
+from .db import AsyncSessionLocal
+from .metrics import UpdateStats, current_update, observe_update
+from .sql_debug import check_update
+from .models import Teacher, Student, Parent
+
+# telegram_id -> (teacher, student, parent), отсоединённые от сессии строки
+identity_cache = TTLCache(
+    maxsize=int(os.getenv("IDENTITY_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("IDENTITY_CACHE_TTL", "300")),
+)
+
+
+def invalidate_identity(telegram_id):
+    """Сбросить кэш роли после регистрации / изменения пользователя"""
+    if telegram_id:
+        identity_cache.pop(str(telegram_id))
+
+
+async def resolve_identity(telegram_id):
+    identity = identity_cache.get(telegram_id)
+    if identity is not None:
+        return identity
+
+    # Все три роли одним запросом: строка-ключ и LEFT JOIN каждой таблицы по telegram_id
+    key = select(literal(telegram_id).label("telegram_id")).subquery()
+    async with AsyncSessionLocal() as db:
+        identity = tuple((await db.execute(
+            select(Teacher, Student, Parent)
+            .select_from(key)
+            .outerjoin(Teacher, Teacher.telegram_id == key.c.telegram_id)
+            .outerjoin(Student, Student.telegram_id == key.c.telegram_id)
+            .outerjoin(Parent, Parent.telegram_id == key.c.telegram_id)
+        )).one())
+
+    # Незарегистрированных не кэшируем: сброс кэша локальный, и другая реплика
+    # после регистрации ещё долго отвечала бы «сначала зарегистрируйтесь»
+    if any(identity):
+        identity_cache.set(telegram_id, identity)
+    return identity
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """
+    Один раз за апдейт определяет, кто пишет боту, и передаёт в хендлер
+    teacher / student / parent (или None). Строки берутся из TTL-кэша,
+    их нельзя менять в хендлерах — для записи перечитывайте по id.
+    """
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        teacher, student, parent = await resolve_identity(str(user.id))
+        data["teacher"] = teacher
+        data["student"] = student
+        data["parent"] = parent
+        return await handler(event, data)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: время апдейта, число и время SQL-запросов,
+    исключения и состояние FSM. Имя хендлера дописывает HandlerNameMiddleware.
+    С SQL_DEBUG=1 после хендлера ищет N+1 и превышение бюджета (sql_debug.py).
+    """
+
+    async def __call__(self, handler, event, data):
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        start = time.perf_counter()
+        error = None
+        try:
+            result = await handler(event, data)
+            check_update(stats)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            current_update.reset(token)
+            observe_update(stats, data.get("raw_state"), time.perf_counter() - start, error)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner-middleware: к этому моменту aiogram уже выбрал хендлер"""
+
+    async def __call__(self, handler, event, data):
+        stats = current_update.get()
+        handler_object = data.get("handler")
+        if stats is not None and handler_object is not None:
+            stats.handler = handler_object.callback.__name__
+            stats.budget = getattr(handler_object.callback, "query_budget", None)
+            stats.budget_base = stats.queries
+        return await handler(event, data)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .db import Base
 import datetime
@@ -32,11 +32,11 @@ class Student(Base):
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(String, unique=True, index=True, nullable=True)
     name = Column(String, nullable=False)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Финансы ученика
-    balance = Column(Integer, default=0)  # Баланс
+    balance = Column(Integer, default=0)  # Устарело: баланс считается по student_ledger (ledger.py)
     price_per_lesson = Column(Integer, nullable=True) # Персональная ставка
 
     teacher = relationship("Teacher", back_populates="students")
@@ -59,6 +59,9 @@ class Parent(Base):
 
 class ParentStudent(Base):
     __tablename__ = "parent_students"
+    __table_args__ = (
+        UniqueConstraint("parent_id", "student_id", name="uq_parent_students_parent_id_student_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     parent_id = Column(Integer, ForeignKey("parents.id"), nullable=False)
@@ -74,7 +77,7 @@ class Group(Base):
     __tablename__ = "groups"
 
     id = Column(Integer, primary_key=True, index=True)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False, index=True)
     title = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
@@ -85,6 +88,10 @@ class Group(Base):
 
 class GroupStudent(Base):
     __tablename__ = "group_students"
+    __table_args__ = (
+        UniqueConstraint("group_id", "student_id", name="uq_group_students_group_id_student_id"),
+        Index("ix_group_students_student_id", "student_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
@@ -99,6 +106,12 @@ class GroupStudent(Base):
 
 class Lesson(Base):
     __tablename__ = "lessons"
+    __table_args__ = (
+        Index("ix_lessons_student_id_start_time", "student_id", "start_time"),
+        Index("ix_lessons_group_id_start_time", "group_id", "start_time"),
+        Index("ix_lessons_teacher_id_start_time", "teacher_id", "start_time"),
+        Index("ix_lessons_held_at_start_time", "held_at", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True)
     teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
@@ -106,6 +119,9 @@ class Lesson(Base):
     student_id = Column(Integer, ForeignKey("students.id"), nullable=True)
     topic = Column(String, nullable=False)
     start_time = Column(DateTime, nullable=False)
+    duration_minutes = Column(Integer, nullable=False, default=60, server_default="60")
+    series_id = Column(String(32), nullable=True)  # общий у уроков одной повторяющейся серии
+    held_at = Column(DateTime, nullable=True)  # урок проведён, занятия списаны
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     teacher = relationship("Teacher", back_populates="lessons")
@@ -113,10 +129,26 @@ class Lesson(Base):
     student = relationship("Student")
 
 
+class LessonDebit(Base):
+    """Списание занятия с баланса ученика; (lesson_id, student_id) — ключ идемпотентности"""
+    __tablename__ = "lesson_debits"
+    __table_args__ = (
+        UniqueConstraint("lesson_id", "student_id", name="uq_lesson_debits_lesson_id_student_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
 # --- Домашние задания ---
 
 class Homework(Base):
     __tablename__ = "homeworks"
+    __table_args__ = (
+        Index("ix_homeworks_teacher_id_saved_in_library", "teacher_id", "saved_in_library"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
@@ -133,6 +165,10 @@ class Homework(Base):
 
 class HomeworkAssignment(Base):
     __tablename__ = "homework_assignments"
+    __table_args__ = (
+        Index("ix_homework_assignments_homework_id_deadline", "homework_id", "deadline"),
+        Index("ix_homework_assignments_deadline", "deadline"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     homework_id = Column(Integer, ForeignKey("homeworks.id"), nullable=False)
@@ -148,6 +184,10 @@ class HomeworkAssignment(Base):
 
 class HomeworkSubmission(Base):
     __tablename__ = "homework_submissions"
+    __table_args__ = (
+        Index("ix_homework_submissions_student_id_status_submitted_at", "student_id", "status", "submitted_at"),
+        Index("ix_homework_submissions_assignment_id_status", "assignment_id", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     assignment_id = Column(Integer, ForeignKey("homework_assignments.id"), nullable=False)
@@ -158,7 +198,9 @@ class HomeworkSubmission(Base):
     score_percent = Column(Integer, nullable=True)
     teacher_comment = Column(Text, nullable=True)
     content = Column(Text, nullable=True)
-    file_path = Column(String, nullable=True)
+    file_path = Column(String, nullable=True)  # в хранилище, по sha256 содержимого
+    file_name = Column(String, nullable=True)  # имя файла, как его прислал ученик
+    reminded_at = Column(DateTime, nullable=True)  # когда ушло напоминание о дедлайне
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     assignment = relationship("HomeworkAssignment", back_populates="submissions")
@@ -203,4 +245,35 @@ class StudentPayment(Base):
     # Связи
     # 3. Добавляем связь с учителем, чтобы работало teacher.student_payments
     teacher = relationship("Teacher", back_populates="student_payments")
-    student = relationship("Student", back_populates="payments")
\ No newline at end of file
+    student = relationship("Student", back_populates="payments")
+
+# --- Журнал баланса занятий ---
+
+class LedgerEntry(Base):
+    """Движение по балансу занятий ученика. Строки только добавляются"""
+    __tablename__ = "student_ledger"
+    __table_args__ = (
+        # Баланс: движения ученика после снимка (id > last_entry_id)
+        Index("ix_student_ledger_student_id_id", "student_id", "id"),
+        # История /ledger: страницы по (created_at, id)
+        Index("ix_student_ledger_student_id_created_at", "student_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    kind = Column(String(20), nullable=False)  # opening, payment, lesson, correction
+    delta = Column(Integer, nullable=False)  # +занятия при оплате, -1 за урок
+    payment_id = Column(Integer, ForeignKey("student_payments.id"), nullable=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
+    comment = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+class BalanceSnapshot(Base):
+    """Баланс ученика по всем движениям с id <= last_entry_id"""
+    __tablename__ = "balance_snapshots"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    balance = Column(Integer, nullable=False)
+    last_entry_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime, nullable=False)  # момент прохода, который обновил снимок
@@ -0,0 +1,303 @@
+"""
+Очередь исходящих уведомлений. Хэндлеры кладут сообщение через notify()
+и сразу отвечают пользователю, отправкой занимается пул воркеров.
+
+Лимиты Telegram соблюдаются двумя token bucket'ами: общий на бота
+(NOTIFY_GLOBAL_RATE сообщений в секунду) и свой на каждый чат
+(NOTIFY_CHAT_RATE). Воркер не ждёт лимита чата: токен бронируется на
+будущее, сообщение возвращается в очередь с not_before, воркер берёт
+следующее — всплеск в один чат не задерживает остальные. Так же, через
+not_before, откладываются повторы. На RetryAfter все воркеры ждут
+сколько сказал Telegram.
+
+NOTIFY_QUEUE=redis хранит очередь в Redis (REDIS_URL) — неотправленное
+переживает рестарт; отложенные сообщения лежат в sorted set по
+not_before. По умолчанию очередь в памяти процесса.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from .fsm_storage import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_QUEUE = os.getenv("NOTIFY_QUEUE", "memory")
+NOTIFY_QUEUE_KEY = os.getenv("NOTIFY_QUEUE_KEY", "notifications:queue")
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "8"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+NOTIFY_CHAT_BURST = int(os.getenv("NOTIFY_CHAT_BURST", "3"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Забирает токен, при нехватке — в долг. Возвращает, через сколько секунд он наш"""
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _MemoryQueue:
+    """Куча по (not_before, порядок поступления)"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    async def put(self, item):
+        heapq.heappush(self._heap, (item.get("not_before", 0), next(self._seq), item))
+        self._changed.set()
+
+    async def get(self):
+        while True:
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+                if timeout <= 0:
+                    return heapq.heappop(self._heap)[2]
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        pass
+
+
+# Созревшие отложенные сообщения — в конец готовой очереди, атомарно
+_PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, item in ipairs(due) do
+    redis.call('ZREM', KEYS[2], item)
+    redis.call('LPUSH', KEYS[1], item)
+end
+return #due
+"""
+
+
+class _RedisQueue:
+    def __init__(self, url, key):
+        from redis.asyncio import Redis
+        self._redis = Redis.from_url(url)
+        self._key = key
+        self._delayed_key = f"{key}:delayed"
+        self._promote = self._redis.register_script(_PROMOTE_DUE)
+
+    async def put(self, item):
+        not_before = item.get("not_before", 0)
+        if not_before > time.time():
+            await self._redis.zadd(self._delayed_key, {json.dumps(item): not_before})
+        else:
+            await self._redis.lpush(self._key, json.dumps(item))
+
+    async def get(self):
+        while True:
+            await self._promote(keys=[self._key, self._delayed_key], args=[time.time()])
+            # Короткий таймаут: при пустой очереди отложенные созревают не позже чем через секунду
+            popped = await self._redis.brpop([self._key], timeout=1)
+            if popped:
+                return json.loads(popped[1])
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class NotificationQueue:
+    def __init__(self, backend, workers=NOTIFY_WORKERS):
+        self.backend = backend
+        self.workers = workers
+        self.global_bucket = TokenBucket(NOTIFY_GLOBAL_RATE, NOTIFY_GLOBAL_RATE)
+        self.chat_buckets = {}
+        self._paused_until = 0.0
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+
+    async def put(self, chat_id, text, **kwargs):
+        # В очередь кладём только JSON-совместимое: chat_id, текст, parse_mode и т.п.
+        # id — чтобы одинаковые сообщения не схлопнулись в sorted set отложенных
+        await self.backend.put({
+            "id": uuid.uuid4().hex, "chat_id": int(chat_id), "text": text, "kwargs": kwargs, "attempt": 0,
+        })
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Полные бакеты ничем не отличаются от новых — выкидываем
+                self.chat_buckets = {k: v for k, v in self.chat_buckets.items() if not v.idle}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(NOTIFY_CHAT_RATE, NOTIFY_CHAT_BURST)
+        return bucket
+
+    async def _send(self, bot, item):
+        """Лимит чата уже соблюдён вызывающим; здесь — общий лимит бота и пауза после RetryAfter"""
+        await self.global_bucket.acquire()
+
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+        await bot.send_message(item["chat_id"], item["text"], **item["kwargs"])
+
+    async def _defer(self, item, delay):
+        item["not_before"] = time.time() + delay
+        await self.backend.put(item)
+
+    async def _retry(self, item, delay):
+        item["attempt"] += 1
+        item.pop("chat_slot", None)
+        if item["attempt"] >= NOTIFY_MAX_ATTEMPTS:
+            self.failed += 1
+            logger.warning("Notification to %s dropped after %s attempts", item["chat_id"], item["attempt"])
+            return
+        await self._defer(item, delay)
+
+    async def _worker(self, bot):
+        while True:
+            item = await self.backend.get()
+            try:
+                if not item.pop("chat_slot", False):
+                    delay = self._chat_bucket(item["chat_id"]).reserve()
+                    if delay > 0:
+                        # Токен чата забронирован на будущее — сообщение ждёт в очереди, а не в воркере
+                        item["chat_slot"] = True
+                        await self._defer(item, delay)
+                        continue
+                await self._send(bot, item)
+                self.sent += 1
+            except TelegramRetryAfter as e:
+                # Флуд-контроль общий на бота — притормаживают все воркеры
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                await self._retry(item, e.retry_after)
+            except TelegramNetworkError as e:
+                logger.warning("Notification to %s failed, retrying: %s", item["chat_id"], e)
+                await self._retry(item, 2 ** item["attempt"])
+            except TelegramAPIError as e:
+                # Бот заблокирован, чат не найден и т.п. — повторять бессмысленно
+                self.failed += 1
+                logger.warning("Notification to %s not delivered: %s", item["chat_id"], e)
+            except Exception:
+                self.failed += 1
+                logger.exception("Notification worker error")
+
+    async def deliver(self, bot, chat_id, text, **kwargs):
+        """Отправить сейчас, в обход очереди, но с теми же лимитами. True — доставлено"""
+        item = {"chat_id": int(chat_id), "text": text, "kwargs": kwargs}
+        for attempt in range(NOTIFY_MAX_ATTEMPTS):
+            try:
+                # Ждёт только сама рассылка, воркеры очереди не заняты
+                await self._chat_bucket(item["chat_id"]).acquire()
+                await self._send(bot, item)
+                return True
+            except TelegramRetryAfter as e:
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramNetworkError:
+                await asyncio.sleep(2 ** attempt)
+            except TelegramAPIError as e:
+                logger.warning("Message to %s not delivered: %s", chat_id, e)
+                return False
+        return False
+
+    def start(self, bot):
+        self._tasks = [asyncio.create_task(self._worker(bot)) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.backend.close()
+
+
+def make_notification_queue():
+    if NOTIFY_QUEUE == "memory":
+        return NotificationQueue(_MemoryQueue())
+    if NOTIFY_QUEUE == "redis":
+        return NotificationQueue(_RedisQueue(REDIS_URL, NOTIFY_QUEUE_KEY))
+    raise RuntimeError(f"Unknown NOTIFY_QUEUE: {NOTIFY_QUEUE}")
+
+
+notifications = make_notification_queue()
+
+
+async def notify(chat_id, text, **kwargs):
+    """Поставить сообщение в очередь, не дожидаясь отправки"""
+    await notifications.put(chat_id, text, **kwargs)
+
+
+# Ссылки на фоновые рассылки, чтобы задачи не собрал GC
+_broadcasts = set()
+
+
+async def broadcast(bot, messages, concurrency=BROADCAST_CONCURRENCY):
+    """Разослать [(chat_id, text), ...] не больше concurrency сообщений разом"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(chat_id, text):
+        async with semaphore:
+            return await notifications.deliver(bot, chat_id, text)
+
+    results = await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+    delivered = sum(results)
+    return delivered, len(results) - delivered
+
+
+def start_broadcast(bot, messages, report_to, title):
+    """Рассылка в фоне; по окончании в report_to уходит отчёт о доставке"""
+
+    async def run():
+        try:
+            delivered, failed = await broadcast(bot, messages)
+        except Exception:
+            logger.exception("Broadcast %r failed", title)
+            return
+        if report_to:
+            await notify(report_to, f"📣 {title}: доставлено {delivered}, не доставлено {failed}")
+
+    task = asyncio.create_task(run())
+    _broadcasts.add(task)
+    task.add_done_callback(_broadcasts.discard)
+
+
+def setup_notifications(dp):
+    async def on_startup(bot):
+        notifications.start(bot)
+
+    async def on_shutdown():
+        await notifications.stop()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
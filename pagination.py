@@ -0,0 +1,84 @@
+import os
+import datetime
+from dataclasses import dataclass
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import tuple_
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+CURSOR_DT_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+class PageCallback(CallbackData, prefix="pg"):
+    view: str    # какой список листаем: assign, library, groups, finance, ledger, hw
+    cursor: str  # ключ первой/последней строки текущей страницы
+    back: bool = False
+
+
+@dataclass
+class Page:
+    rows: list
+    has_prev: bool
+    has_next: bool
+
+
+def encode_cursor(*values):
+    parts = []
+    for v in values:
+        if isinstance(v, datetime.datetime):
+            parts.append(v.strftime(CURSOR_DT_FORMAT))
+        else:
+            parts.append(str(v))
+    return "_".join(parts)
+
+
+def decode_id_cursor(cursor):
+    return int(cursor)
+
+
+def decode_dt_id_cursor(cursor):
+    dt, row_id = cursor.split("_")
+    return datetime.datetime.strptime(dt, CURSOR_DT_FORMAT), int(row_id)
+
+
+async def fetch_page(db, stmt, key_columns, cursor=None, back=False, limit=PAGE_SIZE, desc=False):
+    """
+    Keyset-пагинация: WHERE key > cursor ORDER BY key LIMIT n+1.
+    Назад — то же самое в обратную сторону, строки разворачиваются.
+    desc=True — список идёт от больших ключей к меньшим (новые сверху).
+    stmt передаётся без ORDER BY / LIMIT.
+    """
+    key = tuple_(*key_columns) if len(key_columns) > 1 else key_columns[0]
+    towards_smaller = back != desc
+    if cursor is not None:
+        value = tuple_(*cursor) if len(key_columns) > 1 else cursor
+        stmt = stmt.where(key < value if towards_smaller else key > value)
+
+    order = [c.desc() for c in key_columns] if towards_smaller else list(key_columns)
+    rows = (await db.execute(stmt.order_by(*order).limit(limit + 1))).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if back:
+        rows.reverse()
+        return Page(rows, has_prev=more, has_next=cursor is not None)
+    return Page(rows, has_prev=cursor is not None, has_next=more)
+
+
+def page_keyboard(view, page, cursor_of):
+    """Инлайн-кнопки ⬅️/➡️, cursor_of(row) -> строка курсора"""
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️",
+            callback_data=PageCallback(view=view, cursor=cursor_of(page.rows[0]), back=True).pack()
+        ))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton(
+            text="➡️",
+            callback_data=PageCallback(view=view, cursor=cursor_of(page.rows[-1])).pack()
+        ))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
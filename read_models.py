@@ -0,0 +1,174 @@
+"""
+Read-модели экранов-списков: Core select() по нужным колонкам, строки —
+dataclass со __slots__. Без ORM-сущностей, identity map и отслеживания
+изменений: на больших арендаторах меньше аллокаций на строку и памяти.
+Только для чтения; списки листаются через fetch_page, курсор уже разобран.
+
+Сравнение с ORM: python -m app.bench_read_models
+"""
+import datetime
+import os
+from dataclasses import dataclass
+from sqlalchemy import and_, func, select
+from .ledger import get_balances
+from .models import Group, GroupStudent, Homework, HomeworkAssignment, ParentStudent, Student, Teacher
+from .pagination import PAGE_SIZE, fetch_page
+
+# Сколько имён участников показывать на группу: страница групп влезает в сообщение Telegram
+GROUP_MEMBERS_SHOWN = int(os.getenv("GROUP_MEMBERS_SHOWN", "5"))
+
+
+@dataclass(slots=True)
+class GroupRow:
+    id: int
+    title: str
+    members: list  # первые GROUP_MEMBERS_SHOWN имён в порядке добавления
+    member_count: int
+
+
+@dataclass(slots=True)
+class LibraryRow:
+    id: int
+    title: str
+    content: str | None
+
+
+@dataclass(slots=True)
+class AssignmentRow:
+    id: int
+    assigned_to_type: str
+    assigned_to_ids: list | None
+    deadline: datetime.datetime
+    title: str
+    student_name: str | None
+    group_title: str | None
+
+
+@dataclass(slots=True)
+class BalanceRow:
+    id: int
+    name: str
+    balance: int
+
+
+@dataclass(slots=True)
+class ChildRow:
+    id: int
+    name: str
+    teacher_name: str | None
+    balance: int
+
+
+async def groups_page(db, teacher_id, cursor=None, back=False, limit=PAGE_SIZE):
+    page = await fetch_page(
+        db,
+        select(Group.id, Group.title).filter(Group.teacher_id == teacher_id),
+        (Group.id,),
+        cursor,
+        back,
+        limit,
+    )
+    if not page.rows:
+        return page
+
+    # Первые участники и их общее число по всем группам страницы — одним запросом
+    numbered = (
+        select(
+            GroupStudent.group_id,
+            Student.name,
+            func.row_number().over(partition_by=GroupStudent.group_id, order_by=GroupStudent.id).label("n"),
+            func.count().over(partition_by=GroupStudent.group_id).label("total"),
+        )
+        .join(Student, Student.id == GroupStudent.student_id)
+        .filter(GroupStudent.group_id.in_([g.id for g in page.rows]))
+        .subquery()
+    )
+    members = {}
+    counts = {}
+    rows = await db.execute(
+        select(numbered.c.group_id, numbered.c.name, numbered.c.total)
+        .filter(numbered.c.n <= GROUP_MEMBERS_SHOWN)
+        .order_by(numbered.c.group_id, numbered.c.n)
+    )
+    for group_id, name, total in rows:
+        members.setdefault(group_id, []).append(name)
+        counts[group_id] = total
+
+    page.rows = [GroupRow(g.id, g.title, members.get(g.id, []), counts.get(g.id, 0)) for g in page.rows]
+    return page
+
+
+async def library_page(db, teacher_id, cursor=None, back=False, limit=PAGE_SIZE):
+    page = await fetch_page(
+        db,
+        select(Homework.id, Homework.title, Homework.content)
+        .filter(Homework.teacher_id == teacher_id, Homework.saved_in_library.is_(True)),
+        (Homework.id,),
+        cursor,
+        back,
+        limit,
+    )
+    page.rows = [LibraryRow(*row) for row in page.rows]
+    return page
+
+
+async def assignments_page(db, teacher_id, cursor=None, back=False, limit=PAGE_SIZE):
+    # Назначение + название ДЗ + имя ученика / название группы
+    stmt = (
+        select(
+            HomeworkAssignment.id,
+            HomeworkAssignment.assigned_to_type,
+            HomeworkAssignment.assigned_to_ids,
+            HomeworkAssignment.deadline,
+            Homework.title,
+            Student.name,
+            Group.title,
+        )
+        .join(Homework, Homework.id == HomeworkAssignment.homework_id)
+        .outerjoin(Student, and_(
+            HomeworkAssignment.assigned_to_type == "student",
+            Student.id == HomeworkAssignment.assigned_to_id,
+        ))
+        .outerjoin(Group, and_(
+            HomeworkAssignment.assigned_to_type == "group",
+            Group.id == HomeworkAssignment.assigned_to_id,
+        ))
+        .filter(Homework.teacher_id == teacher_id)
+    )
+    page = await fetch_page(
+        db,
+        stmt,
+        (HomeworkAssignment.deadline, HomeworkAssignment.id),
+        cursor,
+        back,
+        limit,
+    )
+    page.rows = [AssignmentRow(*row) for row in page.rows]
+    return page
+
+
+async def balances_page(db, teacher_id, cursor=None, back=False, limit=PAGE_SIZE):
+    page = await fetch_page(
+        db,
+        select(Student.id, Student.name).filter(Student.teacher_id == teacher_id),
+        (Student.id,),
+        cursor,
+        back,
+        limit,
+    )
+    balances = await get_balances(db, [s.id for s in page.rows])
+    page.rows = [BalanceRow(s.id, s.name, balances.get(s.id, 0)) for s in page.rows]
+    return page
+
+
+async def children(db, parent_id):
+    """Дети родителя с преподавателем и балансом — два запроса на любое число детей"""
+    rows = (await db.execute(
+        select(Student.id, Student.name, Teacher.name)
+        .join(ParentStudent, ParentStudent.student_id == Student.id)
+        .join(Teacher, Teacher.id == Student.teacher_id)
+        .filter(ParentStudent.parent_id == parent_id)
+        .order_by(ParentStudent.id)
+    )).all()
+    balances = await get_balances(db, [row[0] for row in rows])
+    return [ChildRow(student_id, name, teacher_name, balances.get(student_id, 0)) for student_id, name, teacher_name in rows]
@@ -0,0 +1,152 @@
+"""
+Фоновые задачи бота:
+- сдачи со статусом assigned после дедлайна переводятся в overdue одним UPDATE;
+- за REMINDER_HOURS часов до дедлайна ученикам уходит напоминание
+  (через очередь уведомлений, она же следит за лимитами Telegram);
+- закончившиеся уроки закрываются и списываются с баланса учеников;
+- снимки балансов догоняют журнал движений.
+Выборки по ДЗ идут от индекса homework_assignments.deadline,
+по урокам — от (held_at, start_time).
+"""
+import asyncio
+import datetime
+import logging
+import os
+from sqlalchemy import select, update
+from .db import AsyncSessionLocal
+from .ledger import take_snapshots
+from .lessons import debit_finished_lessons
+from .notifications import notify
+from .models import Homework, HomeworkAssignment, HomeworkSubmission, Student
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_INTERVAL = int(os.getenv("SCHEDULER_INTERVAL", "60"))  # секунд между проходами
+REMINDER_HOURS = int(os.getenv("REMINDER_HOURS", "24"))
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", "100"))
+# На сколько секунд назад от прошлого прохода перепроверять дедлайны: назначение,
+# закоммиченное позже своего дедлайна (долгая транзакция), попадёт в следующий проход
+OVERDUE_LOOKBACK = int(os.getenv("OVERDUE_LOOKBACK", "3600"))
+
+# Граница прошлого прохода: следующий смотрит дедлайны не раньше неё минус OVERDUE_LOOKBACK
+_last_sweep = None
+
+
+async def mark_overdue(db, now):
+    """
+    Сдачи assigned с дедлайном с прошлого прохода переводит в overdue —
+    диапазон по индексу deadline, а не вся история. Дедлайн в прошлом
+    на момент создания сюда не доходит: create_assignment сразу
+    вставляет такие сдачи как overdue. Первый проход после старта — по всем.
+    """
+    global _last_sweep
+    expired = select(HomeworkAssignment.id).where(HomeworkAssignment.deadline < now)
+    if _last_sweep is not None:
+        expired = expired.where(
+            HomeworkAssignment.deadline >= _last_sweep - datetime.timedelta(seconds=OVERDUE_LOOKBACK)
+        )
+
+    result = await db.execute(
+        update(HomeworkSubmission)
+        .where(HomeworkSubmission.status == "assigned", HomeworkSubmission.assignment_id.in_(expired))
+        .values(status="overdue")
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    _last_sweep = now
+    return result.rowcount
+
+
+async def claim_reminders(db, now, limit=REMINDER_BATCH):
+    """
+    Забирает пачку сдач, по которым пора напомнить, и сразу помечает
+    reminded_at. SKIP LOCKED — чтобы несколько реплик не слали дубли.
+    """
+    due = (
+        select(HomeworkSubmission.id)
+        .join(HomeworkAssignment, HomeworkAssignment.id == HomeworkSubmission.assignment_id)
+        .join(Student, Student.id == HomeworkSubmission.student_id)
+        .where(
+            HomeworkAssignment.deadline > now,
+            HomeworkAssignment.deadline <= now + datetime.timedelta(hours=REMINDER_HOURS),
+            HomeworkSubmission.status == "assigned",
+            HomeworkSubmission.reminded_at.is_(None),
+            Student.telegram_id.is_not(None),
+        )
+        .order_by(HomeworkAssignment.deadline)
+        .limit(limit)
+        .with_for_update(of=HomeworkSubmission, skip_locked=True)
+    )
+    ids = (await db.scalars(due)).all()
+    if not ids:
+        return []
+
+    await db.execute(
+        update(HomeworkSubmission)
+        .where(HomeworkSubmission.id.in_(ids))
+        .values(reminded_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(
+        select(HomeworkSubmission.id, Student.telegram_id, Homework.title, HomeworkAssignment.deadline)
+        .join(HomeworkAssignment, HomeworkAssignment.id == HomeworkSubmission.assignment_id)
+        .join(Homework, Homework.id == HomeworkAssignment.homework_id)
+        .join(Student, Student.id == HomeworkSubmission.student_id)
+        .where(HomeworkSubmission.id.in_(ids))
+    )).all()
+    await db.commit()
+    return rows
+
+
+async def send_reminders(rows):
+    for row in rows:
+        await notify(
+            row.telegram_id,
+            f"⏰ Напоминание: скоро дедлайн по ДЗ «{row.title}»\n"
+            f"📅 {row.deadline.strftime('%d.%m.%Y %H:%M')}\n"
+            f"💾 Отправьте файл с подписью {row.id}"
+        )
+
+
+async def run_once():
+    now = datetime.datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        overdue = await mark_overdue(db, now)
+        if overdue:
+            logger.info("Marked %s submissions overdue", overdue)
+
+        while True:
+            rows = await claim_reminders(db, now)
+            if not rows:
+                break
+            await send_reminders(rows)
+
+        while await debit_finished_lessons(db, now):
+            pass
+
+        await take_snapshots(db, now)
+
+
+async def scheduler_loop():
+    while True:
+        try:
+            await run_once()
+        except Exception:
+            logger.exception("Deadline scheduler pass failed")
+        await asyncio.sleep(SCHEDULER_INTERVAL)
+
+
+def setup_scheduler(dp):
+    """Запуск вместе с диспетчером (polling или вебхук)"""
+    task = None
+
+    async def on_startup():
+        nonlocal task
+        task = asyncio.create_task(scheduler_loop())
+
+    async def on_shutdown():
+        if task:
+            task.cancel()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
@@ -0,0 +1,71 @@
+"""
+Отладка SQL по апдейтам бота.
+
+Медленные запросы (дольше SLOW_QUERY_MS) пишутся в лог всегда, с именем
+хендлера. SQL_DEBUG=1 дополнительно собирает тексты запросов апдейта и
+после хендлера ищет N+1: один и тот же SQL (отличаются только параметры)
+N_PLUS_ONE_MIN раз и больше. Там же проверяется бюджет запросов,
+объявленный на хендлере через @query_budget.
+
+SQL_DEBUG_STRICT=1 (разработка, CI, python -m app.bench_load) превращает
+найденное в исключение QueryCheckError — апдейт падает.
+"""
+import logging
+import os
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+SQL_DEBUG_STRICT = os.getenv("SQL_DEBUG_STRICT", "0") == "1"
+SQL_DEBUG = SQL_DEBUG_STRICT or os.getenv("SQL_DEBUG", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+N_PLUS_ONE_MIN = int(os.getenv("N_PLUS_ONE_MIN", "3"))
+
+
+class QueryCheckError(Exception):
+    pass
+
+
+def query_budget(limit):
+    """
+    Сколько SQL-запросов может сделать сам хендлер (определение роли в
+    middleware не считается). Ставится под @dp.message / @dp.callback_query.
+    """
+
+    def decorator(func):
+        func.query_budget = limit
+        return func
+
+    return decorator
+
+
+def _short(statement):
+    return " ".join(statement.split())[:300]
+
+
+def log_slow_query(stats, statement, elapsed):
+    if elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    handler = (stats.handler if stats is not None else None) or "-"
+    logger.warning("Slow query in %s: %.0f ms: %s", handler, elapsed * 1000, _short(statement))
+
+
+def check_update(stats):
+    """После хендлера: повторяющиеся запросы и превышение бюджета"""
+    if stats.statements is None:
+        return
+
+    handler = stats.handler or "unhandled"
+    problems = [
+        f"N+1 in {handler}: {count}x {_short(statement)}"
+        for statement, count in Counter(stats.statements).items()
+        if count >= N_PLUS_ONE_MIN
+    ]
+    used = stats.queries - stats.budget_base
+    if stats.budget is not None and used > stats.budget:
+        problems.append(f"{handler} made {used} queries, budget {stats.budget}")
+
+    for problem in problems:
+        logger.warning(problem)
+    if problems and SQL_DEBUG_STRICT:
+        raise QueryCheckError("; ".join(problems))
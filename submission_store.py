@@ -0,0 +1,100 @@
+"""
+Хранилище файлов сдач: файл из Telegram пишется на диск кусками,
+sha256 считается на лету, итоговый путь — по хэшу содержимого.
+Одинаковые файлы хранятся один раз, под каким бы именем их ни прислали:
+исходное имя (и расширение) лежит в homework_submissions.file_name.
+
+Запись на диск, хэш и переименование идут в asyncio.to_thread —
+event loop бота на файловых операциях не стоит.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+
+SUBMISSIONS_DIR = os.getenv("SUBMISSIONS_DIR", "data/submissions")
+# Bot API отдаёт ботам файлы не больше 20 МБ
+MAX_SUBMISSION_SIZE = int(os.getenv("MAX_SUBMISSION_SIZE", str(20 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+
+class SubmissionTooLarge(Exception):
+    pass
+
+
+class _HashingWriter:
+    """Пишет в файл, считает хэш и размер"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > MAX_SUBMISSION_SIZE:
+            raise SubmissionTooLarge()
+        self.sha256.update(chunk)
+        return self.f.write(chunk)
+
+
+def content_path(digest):
+    return os.path.join(SUBMISSIONS_DIR, digest[:2], digest[2:4], digest)
+
+
+async def _file_chunks(bot, file_path):
+    """Содержимое файла Telegram кусками по CHUNK_SIZE"""
+    if bot.session.api.is_local:
+        # Локальный Bot API сервер отдаёт путь к файлу на своём диске
+        f = await asyncio.to_thread(open, bot.session.api.wrap_local_file.to_local(file_path), "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+        return
+
+    url = bot.session.api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(url=url, chunk_size=CHUNK_SIZE, raise_for_status=True):
+        yield chunk
+
+
+def _place(tmp_path, path):
+    if os.path.exists(path):
+        # Такой файл уже есть — повторная сдача места не занимает
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+
+def _discard(tmp_path):
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def store_telegram_file(bot, document):
+    """Скачивает документ из Telegram, возвращает путь к файлу в хранилище"""
+    if document.file_size and document.file_size > MAX_SUBMISSION_SIZE:
+        raise SubmissionTooLarge()
+
+    tmp_dir = os.path.join(SUBMISSIONS_DIR, "tmp")
+    await asyncio.to_thread(os.makedirs, tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    try:
+        file = await bot.get_file(document.file_id)
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            writer = _HashingWriter(f)
+            async for chunk in _file_chunks(bot, file.file_path):
+                await asyncio.to_thread(writer.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+
+        path = content_path(writer.sha256.hexdigest())
+        await asyncio.to_thread(_place, tmp_path, path)
+        return path
+    except BaseException:
+        await asyncio.to_thread(_discard, tmp_path)
+        raise
@@ -0,0 +1,122 @@
+"""
+Общая обвязка тестов: временный SQLite вместо DATABASE_URL, FSM в памяти,
+Bot API заглушен. Окружение ставится до импорта модулей приложения.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import asyncio
+import datetime
+import itertools
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp(prefix="tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/test.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ["FSM_STORAGE"] = "memory"
+os.environ["SUBMISSIONS_DIR"] = os.path.join(_tmp_dir, "submissions")
+
+import pytest
+from aiogram import types
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from sqlalchemy import event
+from .. import models  # noqa: F401 — таблицы в Base.metadata
+from ..db import Base, async_engine, engine
+from ..middlewares import identity_cache
+
+
+class StubSession(BaseSession):
+    """Bot API без сети: запоминает отправленные тексты"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            self.sent.append(method.text)
+            return types.Message(
+                message_id=len(self.sent),
+                date=datetime.datetime.now(),
+                chat=types.Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class Telegram:
+    """Прогон апдейтов через dp.feed_update со всеми middleware"""
+
+    def __init__(self):
+        from ..bot import bot, dp
+        self.bot = bot
+        self.dp = dp
+        self.session = bot.session = StubSession()
+        self._ids = itertools.count(1)
+
+    async def send(self, user_id, text):
+        """Отправить сообщение от user_id, вернуть тексты ответов бота"""
+        sent_before = len(self.session.sent)
+        message = types.Message(
+            message_id=next(self._ids),
+            date=datetime.datetime.now(),
+            chat=types.Chat(id=user_id, type="private"),
+            from_user=types.User(id=user_id, is_bot=False, first_name=f"U{user_id}"),
+            text=text,
+        )
+        await self.dp.feed_update(self.bot, types.Update(update_id=next(self._ids), message=message))
+        return self.session.sent[sent_before:]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+def run(coro):
+    """asyncio.run + закрыть пул async-движка в том же цикле событий"""
+
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def schema():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    identity_cache.clear()
+    yield
+
+
+@pytest.fixture
+def telegram(schema):
+    return Telegram()
+
+
+@pytest.fixture
+def queries():
+    """Запросы через async-движок бота, с момента counter.statements.clear()"""
+    counter = QueryCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
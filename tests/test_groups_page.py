@@ -0,0 +1,37 @@
+from sqlalchemy import insert, select
+from ..db import SessionLocal
+from ..models import Group, GroupStudent, Student, Teacher
+from ..pagination import PAGE_SIZE
+from ..read_models import GROUP_MEMBERS_SHOWN
+from .conftest import run
+
+
+def test_groups_page_fits_telegram_message(telegram, queries):
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="100", name="T", subscription_plan="PREMIUM")
+        db.add(teacher)
+        db.flush()
+        db.execute(insert(Student), [
+            {"name": f"Очень-очень длинное имя ученика номер {i} " * 3, "teacher_id": teacher.id} for i in range(100)
+        ])
+        db.execute(insert(Group), [{"title": f"Группа {i}", "teacher_id": teacher.id} for i in range(PAGE_SIZE)])
+        db.flush()
+        student_ids = db.scalars(select(Student.id)).all()
+        group_ids = db.scalars(select(Group.id)).all()
+        # Каждый ученик — во всех группах страницы
+        db.execute(insert(GroupStudent), [
+            {"group_id": group_id, "student_id": student_id} for group_id in group_ids for student_id in student_ids
+        ])
+        db.commit()
+
+    async def scenario():
+        await telegram.send(100, "/start")
+        queries.statements.clear()
+        replies = await telegram.send(100, "/list_groups")
+        return replies, len(queries)
+
+    replies, count = run(scenario())
+    assert count == 2
+    assert len(replies[0]) <= 4096
+    assert replies[0].count("Учеников: 100") == PAGE_SIZE
+    assert replies[0].count(f"и ещё {100 - GROUP_MEMBERS_SHOWN}") == PAGE_SIZE
@@ -0,0 +1,69 @@
+"""
+Горячие выборки идут по индексам из fdabf1636d4d, 9b1d4e6a2c73 и f3b8d1e6a4c9.
+SQLite: EXPLAIN QUERY PLAN; уникальные ограничения в нём — sqlite_autoindex_<таблица>_N.
+"""
+import pytest
+from sqlalchemy import select
+from ..db import engine
+from ..ledger import _balances_select
+from ..models import (
+    GroupStudent, Group, Homework, HomeworkAssignment, HomeworkSubmission, LedgerEntry, ParentStudent, Student
+)
+
+CASES = [
+    ("students_of_teacher", select(Student.id).filter(Student.teacher_id == 1), "ix_students_teacher_id"),
+    ("groups_of_teacher", select(Group.id).filter(Group.teacher_id == 1), "ix_groups_teacher_id"),
+    (
+        "library",
+        select(Homework.id).filter(Homework.teacher_id == 1, Homework.saved_in_library.is_(True)),
+        "ix_homeworks_teacher_id_saved_in_library",
+    ),
+    (
+        "children_of_parent",
+        select(ParentStudent.student_id).filter(ParentStudent.parent_id == 1),
+        "sqlite_autoindex_parent_students_1",
+    ),
+    (
+        "members_of_groups",
+        select(GroupStudent.student_id).filter(GroupStudent.group_id.in_([1, 2, 3])),
+        "sqlite_autoindex_group_students_1",
+    ),
+    (
+        "groups_of_student",
+        select(GroupStudent.group_id).filter(GroupStudent.student_id == 1),
+        "ix_group_students_student_id",
+    ),
+    (
+        "assignments_of_homework",
+        select(HomeworkAssignment.id).filter(HomeworkAssignment.homework_id == 1).order_by(HomeworkAssignment.deadline),
+        "ix_homework_assignments_homework_id_deadline",
+    ),
+    (
+        "submissions_by_status",
+        select(HomeworkSubmission.id).filter(HomeworkSubmission.assignment_id == 1, HomeworkSubmission.status == "submitted"),
+        "ix_homework_submissions_assignment_id_status",
+    ),
+    (
+        "student_submissions",
+        select(HomeworkSubmission.id).filter(HomeworkSubmission.student_id == 1, HomeworkSubmission.status == "graded"),
+        "ix_homework_submissions_student_id_status_submitted_at",
+    ),
+    ("balances", _balances_select([1, 2, 3]), "ix_student_ledger_student_id_id (student_id=? AND id>?)"),
+    (
+        "ledger_history",
+        select(LedgerEntry.id).filter(LedgerEntry.student_id == 1).order_by(LedgerEntry.created_at, LedgerEntry.id),
+        "ix_student_ledger_student_id_created_at",
+    ),
+]
+
+
+def query_plan(stmt):
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return " / ".join(row.detail for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+@pytest.mark.parametrize("name, stmt, index", CASES, ids=[case[0] for case in CASES])
+def test_lookup_uses_index(schema, name, stmt, index):
+    plan = query_plan(stmt)
+    assert index in plan, plan
@@ -0,0 +1,63 @@
+import datetime
+from sqlalchemy import select
+from .. import ledger
+from ..db import AsyncSessionLocal, SessionLocal
+from ..ledger import _upsert_snapshots, add_entries, get_balance, take_snapshots
+from ..models import BalanceSnapshot, Student, Teacher
+from .conftest import run
+
+
+def seed_student():
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="1", name="T")
+        db.add(teacher)
+        db.flush()
+        student = Student(name="Ученик", teacher_id=teacher.id)
+        db.add(student)
+        db.commit()
+        return student.id
+
+
+def test_backdated_entry_counted_after_snapshot(schema, monkeypatch):
+    monkeypatch.setattr(ledger, "_snapshot_watermark", 0)
+    monkeypatch.setattr(ledger, "LEDGER_SNAPSHOT_LAG", 60)
+    student_id = seed_student()
+    now = datetime.datetime.utcnow()
+
+    def entry(kind, delta, hours_ago):
+        return {"student_id": student_id, "kind": kind, "delta": delta, "created_at": now - datetime.timedelta(hours=hours_ago)}
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await add_entries(db, [entry("payment", 8, 1)])
+            await db.commit()
+            assert await take_snapshots(db, now) == 1
+
+            # Запись задним числом: created_at раньше снимка, id — больше
+            await add_entries(db, [entry("lesson", -1, 2)])
+            await db.commit()
+            before = await get_balance(db, student_id)
+            assert await take_snapshots(db, now) == 1
+            return before, await get_balance(db, student_id)
+
+    assert run(scenario()) == (7, 7)
+    with SessionLocal() as db:
+        assert db.scalars(select(BalanceSnapshot.balance)).all() == [7]
+
+
+def test_snapshot_upsert_keeps_the_furthest(schema):
+    student_id = seed_student()
+    now = datetime.datetime.utcnow()
+
+    async def upsert(balance, last_entry_id):
+        async with AsyncSessionLocal() as db:
+            await db.execute(_upsert_snapshots(db), [
+                {"student_id": student_id, "balance": balance, "last_entry_id": last_entry_id, "as_of": now},
+            ])
+            await db.commit()
+
+    # Две реплики пишут снимок одного ученика: без IntegrityError, отставшая не откатывает
+    run(upsert(5, 10))
+    run(upsert(3, 7))
+    with SessionLocal() as db:
+        assert db.execute(select(BalanceSnapshot.balance, BalanceSnapshot.last_entry_id)).all() == [(5, 10)]
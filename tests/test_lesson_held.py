@@ -0,0 +1,37 @@
+import datetime
+from sqlalchemy import func, select
+from ..db import SessionLocal
+from ..models import Group, GroupStudent, LedgerEntry, Lesson, Student, Teacher
+from .conftest import run
+
+
+def test_future_lesson_cannot_be_marked_held(telegram):
+    now = datetime.datetime.utcnow()
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="100", name="T")
+        db.add(teacher)
+        db.flush()
+        group = Group(title="Группа", teacher_id=teacher.id)
+        students = [Student(name=f"Ученик {i}", teacher_id=teacher.id) for i in range(2)]
+        db.add_all([group, *students])
+        db.flush()
+        db.add_all([GroupStudent(group_id=group.id, student_id=s.id) for s in students])
+        tomorrow = Lesson(teacher_id=teacher.id, group_id=group.id, topic="Завтра",
+                          start_time=now + datetime.timedelta(days=1))
+        started = Lesson(teacher_id=teacher.id, group_id=group.id, topic="Сейчас",
+                         start_time=now - datetime.timedelta(minutes=5))
+        db.add_all([tomorrow, started])
+        db.commit()
+        tomorrow_id, started_id = tomorrow.id, started.id
+
+    def debits():
+        with SessionLocal() as db:
+            return db.scalar(select(func.count()).select_from(LedgerEntry).filter_by(kind="lesson"))
+
+    replies = run(telegram.send(100, f"/lesson_held {tomorrow_id}"))
+    assert "ещё не начался" in replies[0]
+    assert debits() == 0
+
+    replies = run(telegram.send(100, f"/lesson_held {started_id}"))
+    assert "Списано занятий: 2" in replies[0]
+    assert debits() == 2
@@ -0,0 +1,51 @@
+import datetime
+import pytest
+from sqlalchemy import func, select
+from ..bot import ScheduleLesson
+from ..db import SessionLocal
+from ..lessons import LESSON_SERIES_MAX, expand_occurrences, series_last_date
+from ..models import Lesson, Student, Teacher
+from .conftest import run
+
+START = datetime.datetime(2026, 9, 1, 15, 0)
+
+
+def test_series_up_to_limit():
+    last = series_last_date(START, 7)
+    occurrences = expand_occurrences(START, 7, last)
+    assert len(occurrences) == LESSON_SERIES_MAX
+    assert occurrences[-1].date() == last
+
+
+def test_series_beyond_limit_is_refused_not_truncated():
+    with pytest.raises(ValueError):
+        expand_occurrences(START, 7, series_last_date(START, 7) + datetime.timedelta(days=7))
+
+
+def test_bot_asks_again_for_until_beyond_limit(telegram):
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="100", name="T")
+        db.add(teacher)
+        db.flush()
+        student = Student(name="Ученик", teacher_id=teacher.id)
+        db.add(student)
+        db.commit()
+        student_id = student.id
+
+    async def scenario():
+        state = telegram.dp.fsm.get_context(telegram.bot, chat_id=100, user_id=100)
+        await state.set_state(ScheduleLesson.waiting_for_until)
+        await state.set_data({
+            "start_time": START.isoformat(), "topic": "Алгебра", "duration": 60,
+            "target_type": "student", "target_id": student_id, "every_days": 7,
+        })
+        last = series_last_date(START, 7)
+        refused = await telegram.send(100, (last + datetime.timedelta(days=7)).strftime("%Y-%m-%d"))
+        accepted = await telegram.send(100, last.strftime("%Y-%m-%d"))
+        return refused, accepted
+
+    refused, accepted = run(scenario())
+    assert f"не больше {LESSON_SERIES_MAX} уроков" in refused[0]
+    assert f"Назначено уроков: {LESSON_SERIES_MAX}" in accepted[0]
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(Lesson)) == LESSON_SERIES_MAX
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from ..metrics import instrument_engine, query_latency
+
+
+def test_failed_query_does_not_leak_start_time(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/metrics.db")
+    instrument_engine(engine, "test")
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+        assert conn.info["query_start"] == []
+
+    assert any('engine="test"' in line for line in query_latency.render())
+    engine.dispose()
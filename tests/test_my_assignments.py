@@ -0,0 +1,50 @@
+import datetime
+from ..db import SessionLocal
+from ..models import Group, Homework, HomeworkAssignment, Student, Teacher
+from ..pagination import PAGE_SIZE
+from .conftest import run
+
+
+def seed_assignments(telegram_id, count):
+    """Учитель с count назначениями вперемешку: ученику, группе, нескольким"""
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id=str(telegram_id), name="T")
+        db.add(teacher)
+        db.flush()
+        student = Student(name="Ученик", teacher_id=teacher.id)
+        group = Group(title="Группа", teacher_id=teacher.id)
+        db.add_all([student, group])
+        db.flush()
+
+        deadline = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        for i in range(count):
+            homework = Homework(teacher_id=teacher.id, title=f"ДЗ {i}")
+            db.add(homework)
+            db.flush()
+            target_type = ("student", "group", "multi")[i % 3]
+            db.add(HomeworkAssignment(
+                homework_id=homework.id,
+                assigned_to_type=target_type,
+                assigned_to_id={"student": student.id, "group": group.id}.get(target_type),
+                assigned_to_ids=[student.id] if target_type == "multi" else None,
+                deadline=deadline + datetime.timedelta(minutes=i),
+            ))
+        db.commit()
+
+
+def test_my_assignments_query_count_does_not_grow(telegram, queries):
+    seed_assignments(100, 2)
+    seed_assignments(200, PAGE_SIZE)
+
+    async def scenario():
+        counts = {}
+        for telegram_id in (100, 200):
+            await telegram.send(telegram_id, "/start")  # роль учителя в кэше
+            queries.statements.clear()
+            replies = await telegram.send(telegram_id, "/my_assignments")
+            counts[telegram_id] = len(queries)
+            assert "👤 Ученик" in replies[0] and "👥 Группа" in replies[0]
+        return counts
+
+    counts = run(scenario())
+    assert counts[100] == counts[200] == 1
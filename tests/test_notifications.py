@@ -0,0 +1,47 @@
+"""
+Очередь уведомлений: всплеск в один чат не держит воркеров.
+"""
+import asyncio
+import time
+from .. import notifications
+from ..notifications import NotificationQueue, _MemoryQueue
+from .conftest import run
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, time.monotonic()))
+
+
+def test_chat_burst_does_not_block_other_chats(monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFY_CHAT_RATE", 1)
+    monkeypatch.setattr(notifications, "NOTIFY_CHAT_BURST", 1)
+    bot = RecordingBot()
+
+    async def scenario():
+        queue = NotificationQueue(_MemoryQueue(), workers=1)
+        for i in range(5):
+            await queue.put(1, f"A{i}")
+        await queue.put(2, "B")
+
+        started = time.monotonic()
+        queue.start(bot)
+        while not any(chat_id == 2 for chat_id, _ in bot.sent):
+            await asyncio.sleep(0.01)
+        b_delay = time.monotonic() - started
+        a_sent = sum(chat_id == 1 for chat_id, _ in bot.sent)
+
+        # Отложенное сообщение чата A уходит, когда у чата появляется токен
+        while len(bot.sent) < 3:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return b_delay, a_sent
+
+    b_delay, a_sent = run(scenario())
+    assert b_delay < 0.5
+    assert a_sent == 1
+    a_times = [at for chat_id, at in bot.sent if chat_id == 1]
+    assert a_times[1] - a_times[0] >= 0.9
@@ -0,0 +1,28 @@
+from sqlalchemy import update
+from ..db import SessionLocal
+from ..models import Student, Teacher
+from .conftest import run
+
+
+def test_plan_read_from_db_not_identity_cache(telegram):
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="100", name="T", subscription_plan="FREE")
+        db.add(teacher)
+        db.flush()
+        db.add_all([Student(name=f"Ученик {i}", teacher_id=teacher.id) for i in range(3)])
+        db.commit()
+
+    async def scenario():
+        # Роль с тарифом FREE в кэше этого процесса
+        assert "Лимит учеников на тарифе FREE: 3" in (await telegram.send(100, "➕ Добавить ученика"))[0]
+
+        # PRO куплен через другую реплику: её invalidate_identity наш кэш не сбросил
+        with SessionLocal() as db:
+            db.execute(update(Teacher).filter_by(telegram_id="100").values(subscription_plan="PRO"))
+            db.commit()
+
+        return await telegram.send(100, "➕ Добавить ученика"), await telegram.send(100, "💳 Подписка")
+
+    add_student, subscription = run(scenario())
+    assert add_student == ["Введите ФИО ученика:"]
+    assert "<b>PRO</b>" in subscription[0]
@@ -0,0 +1,83 @@
+import datetime
+from sqlalchemy import select
+from .. import scheduler
+from ..assignments import create_assignment
+from ..db import AsyncSessionLocal, SessionLocal
+from ..models import Homework, HomeworkAssignment, HomeworkSubmission, Student, Teacher
+from ..scheduler import mark_overdue
+from .conftest import run
+
+
+def seed_homework():
+    with SessionLocal() as db:
+        teacher = Teacher(telegram_id="1", name="T")
+        db.add(teacher)
+        db.flush()
+        student = Student(name="Ученик", teacher_id=teacher.id)
+        homework = Homework(teacher_id=teacher.id, title="ДЗ")
+        db.add_all([student, homework])
+        db.commit()
+        return homework.id, student.id
+
+
+async def assign(homework_id, student_id, deadline):
+    async with AsyncSessionLocal() as db:
+        _, [(submission_id, _)] = await create_assignment(db, homework_id, "student", [student_id], deadline)
+        await db.commit()
+        return submission_id
+
+
+async def sweep(at):
+    async with AsyncSessionLocal() as db:
+        return await mark_overdue(db, at)
+
+
+def statuses():
+    with SessionLocal() as db:
+        return dict(db.execute(select(HomeworkSubmission.id, HomeworkSubmission.status)).all())
+
+
+def test_overdue_sweep_and_backdated_assignment(schema, monkeypatch):
+    monkeypatch.setattr(scheduler, "_last_sweep", None)
+    homework_id, student_id = seed_homework()
+    now = datetime.datetime.utcnow()
+
+    async def scenario():
+        due = await assign(homework_id, student_id, now + datetime.timedelta(seconds=1))
+        assert await sweep(now) == 0
+        assert await sweep(now + datetime.timedelta(minutes=1)) == 1
+
+        # Назначено после прохода с дедлайном раньше него — overdue сразу, без планировщика
+        backdated = await assign(homework_id, student_id, now - datetime.timedelta(days=2))
+        return due, backdated
+
+    due, backdated = run(scenario())
+    assert statuses() == {due: "overdue", backdated: "overdue"}
+
+
+def insert_assigned(homework_id, student_id, deadline):
+    """Сдача assigned в обход create_assignment — как закоммиченная с опозданием"""
+    with SessionLocal() as db:
+        assignment = HomeworkAssignment(
+            homework_id=homework_id, assigned_to_type="student", assigned_to_id=student_id, deadline=deadline,
+        )
+        db.add(assignment)
+        db.flush()
+        submission = HomeworkSubmission(assignment_id=assignment.id, student_id=student_id, status="assigned")
+        db.add(submission)
+        db.commit()
+        return submission.id
+
+
+def test_sweep_looks_back_only_overdue_lookback(schema, monkeypatch):
+    monkeypatch.setattr(scheduler, "_last_sweep", None)
+    homework_id, student_id = seed_homework()
+    now = datetime.datetime.utcnow()
+    lookback = datetime.timedelta(seconds=scheduler.OVERDUE_LOOKBACK)
+
+    assert run(sweep(now)) == 0
+    late = insert_assigned(homework_id, student_id, now - datetime.timedelta(minutes=10))
+    ancient = insert_assigned(homework_id, student_id, now - lookback - datetime.timedelta(hours=1))
+
+    assert run(sweep(now + datetime.timedelta(minutes=1))) == 1
+    assert statuses() == {late: "overdue", ancient: "assigned"}
@@ -0,0 +1,44 @@
+"""
+Хранилище сдач: одинаковое содержимое под разными именами — один файл.
+"""
+import hashlib
+import os
+from aiogram import Bot, types
+from aiogram.methods import GetFile
+from .conftest import StubSession, run
+from .. import submission_store
+from ..submission_store import store_telegram_file
+
+
+class FileSession(StubSession):
+    """Bot API, у которого file_id — это содержимое файла"""
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, GetFile):
+            return types.File(file_id=method.file_id, file_unique_id=method.file_id, file_path=method.file_id)
+        return await super().make_request(bot, method, timeout)
+
+    async def stream_content(self, url, *args, **kwargs):
+        content = url.rsplit("/", 1)[-1].encode()
+        for i in range(0, len(content), 4):
+            yield content[i:i + 4]
+
+
+def document(content, file_name):
+    return types.Document(file_id=content, file_unique_id=content, file_name=file_name, file_size=len(content))
+
+
+def test_same_content_stored_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(submission_store, "SUBMISSIONS_DIR", str(tmp_path))
+    bot = Bot(token="123456:test", session=FileSession())
+
+    first = run(store_telegram_file(bot, document("homework-1", "work.pdf")))
+    second = run(store_telegram_file(bot, document("homework-1", "Работа.PDF")))
+    other = run(store_telegram_file(bot, document("homework-2", "work.pdf")))
+
+    assert first == second != other
+    # Имя в хранилище — только хэш, без расширения
+    assert os.path.basename(first) == hashlib.sha256(b"homework-1").hexdigest()
+    with open(first, "rb") as f:
+        assert f.read() == b"homework-1"
+    assert os.listdir(tmp_path / "tmp") == []
@@ -0,0 +1,53 @@
+import asyncio
+import datetime
+import pytest
+from aiogram import types
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from .. import webhook
+
+
+def make_update(text):
+    return types.Update(update_id=1, message=types.Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=types.Chat(id=1, type="private"),
+        from_user=types.User(id=1, is_bot=False, first_name="U"),
+        text=text,
+    )).model_dump(mode="json", exclude_none=True)
+
+
+def test_handler_error_is_acknowledged(monkeypatch):
+    async def failing_feed_update(bot, update):
+        raise RuntimeError("handler failed")
+
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "secret")
+    monkeypatch.setattr(webhook.dp, "feed_update", failing_feed_update)
+    app = FastAPI()
+    app.include_router(webhook.router)
+    client = TestClient(app)
+
+    # Апдейт с ошибкой в хендлере подтверждается, иначе Telegram пришлёт его снова
+    response = client.post(webhook.WEBHOOK_PATH, json=make_update("/start"),
+                           headers={"X-Telegram-Bot-Api-Secret-Token": "secret"})
+    assert response.status_code == 200
+
+    # Чужой секрет по-прежнему отклоняется
+    response = client.post(webhook.WEBHOOK_PATH, json=make_update("/start"),
+                           headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+    assert response.status_code == 403
+
+
+def test_secret_is_required(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", None)
+    monkeypatch.setattr(webhook, "WEBHOOK_URL", "https://example.com")
+    app = FastAPI()
+    app.include_router(webhook.router)
+    client = TestClient(app)
+
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": ""}):
+        response = client.post(webhook.WEBHOOK_PATH, json=make_update("/start"), headers=headers)
+        assert response.status_code == 403
+
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        asyncio.run(webhook.on_startup())
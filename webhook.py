@@ -0,0 +1,65 @@
+"""
+Приём апдейтов Telegram через вебхук на FastAPI-приложении из main.py.
+Включается BOT_MODE=webhook, по умолчанию бот работает через polling (python -m app.bot).
+"""
+import asyncio
+import hmac
+import logging
+import os
+from aiogram import types
+from fastapi import APIRouter, Header, HTTPException, Request
+from .bot import bot, dp
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный https-адрес API, без пути
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # обязателен: иначе апдейт от чужого имени пришлёт кто угодно
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "50"))
+
+# Сколько апдейтов обрабатываем одновременно; остальные ждут своей очереди,
+# Telegram при таймауте сам повторит доставку
+_semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+
+
+async def on_startup():
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is not set in environment")
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is not set in environment")
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    # В режиме вебхука start_polling не вызывается — фоновые задачи диспетчера запускаем сами
+    await dp.emit_startup(bot=bot)
+
+
+async def on_shutdown():
+    await dp.emit_shutdown(bot=bot)
+    await dp.storage.close()
+    await bot.session.close()
+
+
+router = APIRouter()
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(default=None),
+):
+    # Без настроенного секрета не принимаем ничего, а не всё подряд
+    if not WEBHOOK_SECRET or not hmac.compare_digest(x_telegram_bot_api_secret_token or "", WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    update = types.Update.model_validate(await request.json(), context={"bot": bot})
+    async with _semaphore:
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            # Как в polling: логируем и подтверждаем апдейт. Ответ 5xx заставил бы
+            # Telegram доставить его повторно и повторить побочные эффекты хендлера
+            logger.exception("Update %s failed", update.update_id)
+    return {"ok": True}